@@ -8,21 +8,50 @@ import json
 import time
 import base64
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, request, jsonify
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
+from selenium.common.exceptions import WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
 import google.generativeai as genai
 import PyPDF2
+import io
+import codecs
+import mmap
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, limits stay per-process
+    fcntl = None
 from io import BytesIO
+from array import array
 import threading
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FuturesTimeout
+import queue
+import atexit
+from contextlib import contextmanager
 import pandas as pd
+import numpy as np
 import re
+import math
+import random
 from PIL import Image
-from collections import Counter
+from collections import Counter, OrderedDict, namedtuple
 import hashlib
+import copy
+import sqlite3
+import uuid
+import struct
+from functools import cached_property
+import pickle
+import tempfile
+from html import unescape as html_unescape
 
 app = Flask(__name__)
 
@@ -33,16 +62,650 @@ GEMINI_API_KEY = "get-your-api-key"
 # Configure Gemini
 genai.configure(api_key=GEMINI_API_KEY)
 
+# Download settings
+MAX_DOWNLOAD_BYTES = int(os.environ.get('MAX_DOWNLOAD_MB', 512)) * 1024 * 1024
+SPILL_THRESHOLD = int(os.environ.get('SPILL_THRESHOLD_MB', 8)) * 1024 * 1024  # Larger bodies go to a temp file
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+class _MappedStream(io.RawIOBase):
+    """Independent read position over a shared memoryview"""
+    
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+    
+    def tell(self):
+        return self._pos
+
+class MappedContent:
+    """Large file body kept in a read-only memory map instead of a bytes copy"""
+    
+    def __init__(self, file):
+        file.flush()
+        self._file = file  # Keeps temp files alive until the map is dropped
+        self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self._mmap)
+    
+    def __len__(self):
+        return len(self._mmap)
+    
+    def open(self):
+        """New seekable stream over the map - parsers read it without copying"""
+        return io.BufferedReader(_MappedStream(self.buffer))
+    
+    def decode(self, encoding='utf-8', errors='strict'):
+        return str(self.buffer, encoding, errors)
+
+def open_stream(content):
+    """File-like view of downloaded content for PyPDF2 / pandas / PIL"""
+    if isinstance(content, MappedContent):
+        return content.open()
+    return BytesIO(content)
+
+def as_buffer(content):
+    """Bytes-like view of downloaded content"""
+    return content.buffer if isinstance(content, MappedContent) else content
+
+# Cache settings
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_MB', 256)) * 1024 * 1024
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 3600))  # Seconds
+PAGE_CACHE_TTL = float(os.environ.get('PAGE_CACHE_TTL', 600))
+
+def estimate_size(value):
+    """Approximate in-memory size of a cached value in bytes"""
+    if isinstance(value, (bytes, bytearray, memoryview, MappedContent)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_size(v) for v in value) + 64
+    if isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items()) + 64
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    nbytes = getattr(value, 'nbytes', None)  # NumPy arrays, SqlDatabase
+    if isinstance(nbytes, int):
+        return nbytes
+    return 64
+
+class LRUCache:
+    """Thread-safe LRU cache with a byte budget and per-entry TTL"""
+    
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, default_ttl=CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+    
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, _, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key, value, ttl=None):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return False  # Never worth evicting everything for one entry
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+    
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry[2] is None or entry[2] > time.time())
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
 # Global cache to avoid reprocessing
-CACHE = {}
-API_STATS = {
-    'total_calls': 0,
-    'call_times': [],
-    'logic_solves': 0,
-    'pattern_solves': 0,
-    'gemini_solves': 0
+CACHE = LRUCache()
+
+# Optional on-disk cache that survives restarts (disabled unless DISK_CACHE_DIR is set)
+DISK_CACHE_DIR = os.environ.get('DISK_CACHE_DIR')
+DISK_CACHE_MAX_BYTES = int(os.environ.get('DISK_CACHE_MAX_MB', 1024)) * 1024 * 1024
+
+def content_hash(content):
+    """SHA-256 of raw file bytes"""
+    return hashlib.sha256(as_buffer(content)).hexdigest()
+
+ParquetFrame = namedtuple('ParquetFrame', [])  # Stands in for a DataFrame kept in the .parquet file next to the pickle
+
+class DiskCache:
+    """Content-addressed on-disk cache for downloaded bytes and parsed artifacts
+    
+    Layout:
+        urls/<sha256(url)>.json     -> {"sha256": ..., plus response metadata}
+        blobs/<sha256>.bin          -> raw bytes
+        parsed/<sha256>.<kind>.*    -> parsed result (parquet for DataFrames, else pickle)
+    
+    Objects carrying a DataFrame in .frame (CsvTable) keep the frame in parquet and the rest
+    in the pickle, which then holds a ParquetFrame in place of the frame.
+    """
+    
+    def __init__(self, root, max_bytes=DISK_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        for sub in ('urls', 'blobs', 'parsed'):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+        self._bytes = sum(os.path.getsize(p) for p in self._files())
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def _files(self):
+        for sub in ('urls', 'blobs', 'parsed'):
+            folder = os.path.join(self.root, sub)
+            for name in os.listdir(folder):
+                if not name.startswith('.tmp'):
+                    yield os.path.join(folder, name)
+    
+    def _write_atomic(self, path, writer):
+        """Write via temp file + rename so readers never see partial files"""
+        folder = os.path.dirname(path)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.tmp')
+        os.close(fd)
+        try:
+            writer(tmp_path)
+            size = os.path.getsize(tmp_path)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._bytes += size - old_size
+        self._enforce_cap()
+    
+    def _write_bytes(self, path, data):
+        def writer(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        self._write_atomic(path, writer)
+    
+    def _read_bytes(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Keep recently used entries away from eviction
+            return data
+        except OSError:
+            return None
+    
+    def _enforce_cap(self):
+        with self._lock:
+            if self._bytes <= self.max_bytes:
+                return
+            entries = []
+            for path in self._files():
+                try:
+                    st = os.stat(path)
+                    entries.append((st.st_mtime, st.st_size, path))
+                except OSError:
+                    pass
+            entries.sort()
+            target = self.max_bytes * 0.9
+            for _, size, path in entries:
+                if self._bytes <= target:
+                    break
+                try:
+                    os.remove(path)
+                    self._bytes -= size
+                    self.evictions += 1
+                except OSError:
+                    pass
+    
+    def _url_path(self, url):
+        return os.path.join(self.root, 'urls', hashlib.sha256(url.encode()).hexdigest() + '.json')
+    
+    def _blob_path(self, digest):
+        return os.path.join(self.root, 'blobs', digest + '.bin')
+    
+    def url_meta(self, url):
+        """Metadata recorded for a URL, or None"""
+        data = self._read_bytes(self._url_path(url))
+        if data is None:
+            return None
+        try:
+            return json.loads(data.decode('utf-8'))
+        except ValueError:
+            return None
+    
+    def _map_file(self, path):
+        try:
+            content = MappedContent(open(path, 'rb'))
+            os.utime(path)
+            return content
+        except (OSError, ValueError):
+            return None
+    
+    def get_blob(self, digest):
+        """Raw bytes stored under a content hash, or None if missing or corrupt"""
+        path = self._blob_path(digest)
+        try:
+            large = os.path.getsize(path) > SPILL_THRESHOLD
+        except OSError:
+            large = False
+        content = self._map_file(path) if large else self._read_bytes(path)
+        if content is None or content_hash(content) != digest:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return content
+    
+    def get_url(self, url):
+        """Raw bytes last downloaded from url, or None"""
+        meta = self.url_meta(url)
+        if not meta:
+            self.misses += 1
+            return None
+        return self.get_blob(meta['sha256'])
+    
+    def mark_validated(self, url, meta):
+        """Record that the server confirmed the stored copy is current (304)"""
+        meta = dict(meta, validated_at=time.time())
+        self._write_bytes(self._url_path(url), json.dumps(meta).encode('utf-8'))
+    
+    def put_url(self, url, content, **meta):
+        """Store downloaded bytes under their content hash and index them by URL"""
+        digest = content_hash(content)
+        blob_path = self._blob_path(digest)
+        if not os.path.exists(blob_path):
+            self._write_bytes(blob_path, as_buffer(content))
+        now = time.time()
+        meta.update({'sha256': digest, 'url': url, 'size': len(content), 'stored_at': now, 'validated_at': now})
+        self._write_bytes(self._url_path(url), json.dumps(meta).encode('utf-8'))
+        return digest
+    
+    def get_parsed(self, digest, kind):
+        """Parsed artifact for content hash, or None"""
+        base = os.path.join(self.root, 'parsed', f"{digest}.{kind}")
+        try:
+            data = self._read_bytes(base + '.pkl')
+            if data is not None:
+                value = pickle.loads(data)
+                if isinstance(value, ParquetFrame) or isinstance(getattr(value, 'frame', None), ParquetFrame):
+                    frame = pd.read_parquet(base + '.parquet')  # Evicted on its own: a miss
+                    os.utime(base + '.parquet')
+                    if isinstance(value, ParquetFrame):
+                        value = frame
+                    else:
+                        value.frame = frame
+                self.hits += 1
+                return value
+        except Exception as e:
+            print(f"Disk cache read error ({kind}): {e}")
+        self.misses += 1
+        return None
+    
+    def put_parsed(self, digest, kind, value):
+        base = os.path.join(self.root, 'parsed', f"{digest}.{kind}")
+        try:
+            frame = value if isinstance(value, pd.DataFrame) else getattr(value, 'frame', None)
+            if isinstance(frame, pd.DataFrame):
+                try:
+                    self._write_atomic(base + '.parquet', lambda p: frame.to_parquet(p, index=False))
+                except Exception as e:
+                    # No parquet engine, or mixed-type columns arrow can't store - pickle it all
+                    print(f"Disk cache: {kind} frame not stored as parquet ({e.__class__.__name__})")
+                else:
+                    if frame is value:
+                        value = ParquetFrame()
+                    else:
+                        value = copy.copy(value)
+                        value.frame = ParquetFrame()
+            self._write_bytes(base + '.pkl', pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception as e:
+            print(f"Disk cache write error ({kind}): {e}")
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'dir': self.root,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+DISK_CACHE = DiskCache(DISK_CACHE_DIR) if DISK_CACHE_DIR else None
+
+def cached_parse(kind, content, parser):
+    """Run parser(content), reusing a result stored on disk for the same bytes"""
+    if not DISK_CACHE:
+        return parser(content)
+    digest = content_hash(content)
+    value = DISK_CACHE.get_parsed(digest, kind)
+    if value is not None:
+        print(f"↻ Using parsed {kind} from disk")
+        return value
+    value = parser(content)
+    if value is not None:
+        DISK_CACHE.put_parsed(digest, kind, value)
+    return value
+
+# API usage + rate limit state. Shared across worker processes on this host unless
+# RATE_STATE_FILE=off, so the Gemini budget is enforced globally, not per worker.
+RATE_STATE_FILE = os.environ.get('RATE_STATE_FILE', os.path.join(tempfile.gettempdir(), 'quiz-solver-rate.bin'))
+STAT_NAMES = ('total_calls', 'logic_solves', 'pattern_solves', 'gemini_solves')
+CALL_RING_SIZE = 128  # Recent call timestamps kept for /health (must exceed calls per minute)
+
+def new_rate_state():
+    state = {name: 0 for name in STAT_NAMES}
+    state.update({'tat': 0.0, 'blocked_until': 0.0, 'ring_pos': 0, 'ring': [0.0] * CALL_RING_SIZE})
+    return state
+
+def recent_calls(state, now=None):
+    now = time.time() if now is None else now
+    return sorted(t for t in state['ring'] if now - t < 60)
+
+class LocalRateState:
+    """Per-process rate state (single worker, or no file locking available)"""
+    
+    kind = 'local'
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = new_rate_state()
+    
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            yield self._state
+
+class SharedRateState:
+    """Rate state in a small mmapped file, guarded by flock, shared by all processes on the host
+    
+    Each process opens the file itself (forked workers reopen on first use): flock only excludes
+    other open file descriptions, so an fd inherited from the parent would lock nothing.
+    Every user holds a shared lock on a sidecar file; the first one to find no other holder
+    starts from a fresh state instead of the counters and penalties of an earlier run.
+    """
+    
+    kind = 'shared'
+    MAGIC = b'QSRS'
+    VERSION = 1
+    LAYOUT = struct.Struct(f'<4sIdd{len(STAT_NAMES)}qI{CALL_RING_SIZE}d')
+    
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()  # flock does not exclude threads sharing one fd
+        self._pid = None
+        self._fd = self._users_fd = self._map = None
+        self._open()  # Fail here, not mid-request, if the file cannot be used
+    
+    def _open(self):
+        """Open (or, after a fork, reopen) the file for this process"""
+        for fd in (self._fd, self._users_fd):
+            if fd is not None:
+                os.close(fd)  # The parent's descriptors - closing our copies leaves its locks alone
+        self._users_fd = os.open(self.path + '.users', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._users_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            stale = True  # Nobody else is using the state: it is left over from an earlier run
+        except OSError:
+            stale = False
+        fcntl.flock(self._users_fd, fcntl.LOCK_SH)  # Held for the life of the process
+        
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != self.LAYOUT.size:
+                os.ftruncate(self._fd, self.LAYOUT.size)
+            self._map = mmap.mmap(self._fd, self.LAYOUT.size)
+            if stale or self._map[:4] != self.MAGIC or self._read().get('version') != self.VERSION:
+                self._write(new_rate_state())
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._pid = os.getpid()
+    
+    def _read(self):
+        fields = self.LAYOUT.unpack_from(self._map)
+        n = len(STAT_NAMES)
+        state = {'version': fields[1], 'tat': fields[2], 'blocked_until': fields[3]}
+        state.update(zip(STAT_NAMES, fields[4:4 + n]))
+        state['ring_pos'] = fields[4 + n]
+        state['ring'] = list(fields[5 + n:])
+        return state
+    
+    def _write(self, state):
+        self.LAYOUT.pack_into(self._map, 0, self.MAGIC, self.VERSION, state['tat'], state['blocked_until'],
+                              *[state[name] for name in STAT_NAMES], state['ring_pos'], *state['ring'])
+    
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                state = self._read()
+                yield state
+                self._write(state)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+def create_rate_state():
+    if fcntl is None or RATE_STATE_FILE.lower() in ('', 'off', 'none'):
+        return LocalRateState()
+    try:
+        return SharedRateState(RATE_STATE_FILE)
+    except (OSError, ValueError) as e:
+        print(f"Shared rate state unavailable, using per-process limits: {e}")
+        return LocalRateState()
+
+RATE_STATE = create_rate_state()
+
+def api_stats():
+    """Usage counters (global across workers when the shared backend is active)"""
+    with RATE_STATE.transaction() as state:
+        stats = {name: state[name] for name in STAT_NAMES}
+        stats['call_times'] = recent_calls(state)
+    return stats
+
+# Gemini prompt budget
+GEMINI_CONTEXT_TOKENS = int(os.environ.get('GEMINI_CONTEXT_TOKENS', 1500))
+CHUNK_CHARS = 1200
+STOPWORDS = frozenset(
+    'a an and are as at be by for from how in is it of on or the this that to was what which with '
+    'your you find give return answer question data file value'.split()
+)
+
+# Gemini response cache settings
+GEMINI_MODEL = 'gemini-2.0-flash-exp'  # Use experimental for better quota
+LLM_CACHE_TTL = float(os.environ.get('LLM_CACHE_TTL', 7 * 24 * 3600))
+LLM_CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_MB', 16)) * 1024 * 1024
+
+# Gemini call settings
+GEMINI_STREAM = os.environ.get('GEMINI_STREAM', '1') != '0'
+GEMINI_CALL_TIMEOUT = float(os.environ.get('GEMINI_CALL_TIMEOUT', 30))  # Wall clock per call
+GEMINI_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix='gemini')
+
+# Hedged solving: when only generic rules match, race Gemini against the fallbacks
+HEDGED_SOLVE = os.environ.get('HEDGED_SOLVE', '0') == '1'
+HEDGE_WAIT = float(os.environ.get('HEDGE_WAIT', 20))  # Max wait for Gemini when a fallback exists
+ANSWER_CONFIDENCE = {'gemini': 0.7, 'pattern': 0.5, 'generic_logic': 0.4}  # Specific rules always win
+HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix='hedge')
+
+# Gemini rate limit settings
+GEMINI_CALLS_PER_MINUTE = float(os.environ.get('GEMINI_CALLS_PER_MINUTE', 15))
+GEMINI_BURST = int(os.environ.get('GEMINI_BURST', 3))
+GEMINI_MAX_ATTEMPTS = 3
+GEMINI_BACKOFF_BASE = 10  # Seconds, used when the server gives no Retry-After
+RETRY_AFTER_PATTERN = re.compile(r'retry[ _-]?(?:after|delay)\D{0,20}?(\d+(?:\.\d+)?)', re.IGNORECASE)
+
+# File processing settings
+FILE_WORKERS = int(os.environ.get('FILE_WORKERS', 4))
+FILE_TIMEOUT = float(os.environ.get('FILE_TIMEOUT', 60))  # Per file, seconds
+MAX_BYTES_IN_FLIGHT = int(os.environ.get('MAX_MB_IN_FLIGHT', 256)) * 1024 * 1024
+FILE_EXTENSIONS = ['.pdf', '.csv', '.json', '.png', '.jpg', '.txt', '.sql']
+
+# CSV ingestion settings
+CSV_CHUNK_ROWS = int(os.environ.get('CSV_CHUNK_ROWS', 100000))
+CSV_FULL_FRAME_BYTES = int(os.environ.get('CSV_FULL_FRAME_MB', 64)) * 1024 * 1024  # Larger files keep stats + sample only
+CSV_CONTEXT_ROWS = 50  # Tables up to this size go into the context in full
+CSV_SAMPLE_ROWS = 15
+CSV_MAX_DISTINCT = 1000  # Value counts are kept for columns with at most this many distinct values
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+# JSON index settings
+JSON_CONTEXT_CHARS = int(os.environ.get('JSON_CONTEXT_CHARS', 20000))  # Larger documents: path index + preview only
+JSON_FULL_BYTES = int(os.environ.get('JSON_FULL_MB', 64)) * 1024 * 1024  # Larger top-level arrays keep record offsets only
+JSON_MAX_DISTINCT = 1000  # Value histograms are kept for paths with at most this many distinct values
+
+# Text file settings
+TEXT_CHUNK_BYTES = 4 * 1024 * 1024  # Scanned a chunk at a time, cut at line ends
+TEXT_CONTEXT_CHARS = int(os.environ.get('TEXT_CONTEXT_CHARS', 20000))  # Larger files: stats + preview only
+TEXT_MAX_VOCAB = 200000  # Distinct tokens tracked before rare ones are pruned
+TEXT_LOG_LEVELS = {'error': [b'error'], 'warning': [b'warn', b'warning'], 'info': [b'info'], 'debug': [b'debug']}
+TEXT_PATTERNS = {  # name: (marker a chunk must contain, pattern)
+    'ipv4': (b'.', re.compile(rb'\b(?:\d{1,3}\.){3}\d{1,3}\b')),
+    'url': (b'://', re.compile(rb'https?://[^\s"\'<>]+')),
+    'email': (b'@', re.compile(rb'\b[\w.%+-]+@[\w.-]+\.[A-Za-z]{2,}\b')),
 }
 
+# SQL engine settings
+SQL_BATCH_STATEMENTS = 5000  # Statements per transaction while loading a dump
+SQL_CONTEXT_CHARS = int(os.environ.get('SQL_CONTEXT_CHARS', 20000))  # Larger dumps: schema + preview only
+SQL_CACHE_MAX_BYTES = int(os.environ.get('SQL_CACHE_MAX_MB', 256)) * 1024 * 1024
+SQL_QUERY_TIMEOUT = 10  # Seconds a query may run when the step sets no earlier deadline
+SQL_PROGRESS_OPS = 10000  # SQLite VM steps between deadline checks
+
+# HTTP client settings
+HTTP_POOL_HOSTS = 10
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 16))  # Connections kept per host
+HTTP_RETRIES = 3
+FILE_REVALIDATE_AFTER = float(os.environ.get('FILE_REVALIDATE_AFTER', 3600))  # Seconds before a 304 check
+
+# PDF extraction settings
+PDF_PROCESS_WORKERS = int(os.environ.get('PDF_PROCESS_WORKERS', min(4, os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 20))
+
+# Image analysis settings
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 0))  # 0 = exact counts, no downsampling
+IMAGE_PALETTE_SIZE = 5
+
+# Browser pool settings
+BROWSER_POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', 2))
+BROWSER_MAX_USES = int(os.environ.get('BROWSER_MAX_USES', 50))  # Recycle to cap leaks
+BROWSER_CHECKOUT_TIMEOUT = 120
+
+# Page readiness settings
+PAGE_READY_TIMEOUT = float(os.environ.get('PAGE_READY_TIMEOUT', 10))  # Ceiling, seconds
+PAGE_READY_POLL = 0.25
+STATIC_FETCH_ENABLED = os.environ.get('STATIC_FETCH', '1') != '0'
+PAGE_LOAD_TIMEOUT = 60
+
+# Quiz scheduling settings
+QUIZ_TIME_LIMIT = float(os.environ.get('QUIZ_TIME_LIMIT', 180))  # Per quiz step, seconds
+SUBMIT_RESERVE = float(os.environ.get('SUBMIT_RESERVE', 10))  # Held back so an answer always goes out
+STAGE_SHARES = {'fetch': 0.3, 'files': 0.6}  # Share of the time left when the stage starts; solve gets the rest
+MIN_STAGE_SECONDS = 1.0  # Skip a stage rather than start it with less than this
+MAX_QUIZ_STEPS = 30
+MIN_STEP_GAP = float(os.environ.get('MIN_STEP_GAP', 0.5))
+MAX_STEP_GAP = float(os.environ.get('MAX_STEP_GAP', 30))
+
+# Job queue settings
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', BROWSER_POOL_SIZE))  # One browser per running sequence
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 8))  # Waiting jobs beyond this get a 429
+JOB_HISTORY = 200  # Finished jobs kept for /jobs/<id>
+
+# Async engine settings
+ASYNC_ENGINE = os.environ.get('ASYNC_ENGINE', '0') == '1'  # Run sequences as coroutines instead of threads
+ASYNC_MAX_SEQUENCES = int(os.environ.get('ASYNC_MAX_SEQUENCES', 256))
+ASYNC_IO_WORKERS = int(os.environ.get('ASYNC_IO_WORKERS', 32))  # Threads for blocking HTTP calls
+
+# Inline scripts that build the page client-side (e.g. innerHTML = atob(...)); each match stays inside one <script>
+DYNAMIC_SCRIPT_PATTERN = re.compile(
+    r'<script\b[^>]*>(?:(?!</script).)*?'
+    r'(?:innerHTML|outerHTML|document\.write|atob\(|appendChild|textContent|insertAdjacent)',
+    re.IGNORECASE | re.DOTALL
+)
+SUBMIT_URL_PATTERN = re.compile(r'https://[^\s<>"]+/submit')
+
+_CHROMEDRIVER_PATH = None
+_CHROMEDRIVER_RESOLVED = False
+_CHROMEDRIVER_LOCK = threading.Lock()
+
+def resolve_chromedriver():
+    """Resolve chromedriver path once per process"""
+    global _CHROMEDRIVER_PATH, _CHROMEDRIVER_RESOLVED
+    with _CHROMEDRIVER_LOCK:
+        if not _CHROMEDRIVER_RESOLVED:
+            try:
+                _CHROMEDRIVER_PATH = ChromeDriverManager().install()
+            except Exception as e:
+                print(f"ChromeDriverManager failed, using PATH driver: {e}")
+                _CHROMEDRIVER_PATH = None
+            _CHROMEDRIVER_RESOLVED = True
+    return _CHROMEDRIVER_PATH
+
 def setup_browser():
     """Setup headless Chrome browser"""
     chrome_options = Options()
@@ -52,115 +715,1499 @@ def setup_browser():
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--window-size=1920,1080")
     
+    driver_path = resolve_chromedriver()
     try:
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
+        if driver_path:
+            driver = webdriver.Chrome(service=Service(driver_path), options=chrome_options)
+        else:
+            driver = webdriver.Chrome(options=chrome_options)
     except:
         driver = webdriver.Chrome(options=chrome_options)
     
     return driver
 
-def fetch_quiz_page(url):
+class BrowserPool:
+    """Fixed-size pool of long-lived headless Chrome instances"""
+    
+    def __init__(self, size=BROWSER_POOL_SIZE, max_uses=BROWSER_MAX_USES):
+        self.size = size
+        self.max_uses = max_uses
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._uses = {}
+        self.stats = {'launched': 0, 'recycled': 0, 'checkouts': 0}
+    
+    def _launch(self):
+        driver = setup_browser()
+        with self._lock:
+            self._uses[id(driver)] = 0
+            self.stats['launched'] += 1
+        return driver
+    
+    def _is_healthy(self, driver):
+        try:
+            return driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+    
+    def _discard(self, driver):
+        with self._lock:
+            self._uses.pop(id(driver), None)
+            self._created -= 1
+            self.stats['recycled'] += 1
+        try:
+            driver.quit()
+        except Exception:
+            pass
+    
+    def _reset(self, driver):
+        """Clear per-quiz state before the next checkout"""
+        try:
+            driver.delete_all_cookies()
+            driver.execute_script("try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}")
+            driver.get("about:blank")
+            return True
+        except Exception:
+            return False
+    
+    def acquire(self, timeout=BROWSER_CHECKOUT_TIMEOUT):
+        """Check out a healthy driver, launching one if the pool is not full"""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = None
+                with self._lock:
+                    can_launch = self._created < self.size
+                    if can_launch:
+                        self._created += 1
+                if can_launch:
+                    try:
+                        driver = self._launch()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise TimeoutError("No browser available in pool")
+                    try:
+                        driver = self._idle.get(timeout=remaining)
+                    except queue.Empty:
+                        raise TimeoutError("No browser available in pool")
+            
+            if self._is_healthy(driver):
+                with self._lock:
+                    self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+                    self.stats['checkouts'] += 1
+                return driver
+            print("♻️ Recycling crashed browser")
+            self._discard(driver)
+    
+    def release(self, driver, broken=False):
+        """Return a driver to the pool, recycling it if broken or worn out"""
+        with self._lock:
+            worn_out = self._uses.get(id(driver), 0) >= self.max_uses
+        if broken or worn_out or not self._reset(driver):
+            self._discard(driver)
+            return
+        self._idle.put(driver)
+    
+    @contextmanager
+    def browser(self, timeout=BROWSER_CHECKOUT_TIMEOUT):
+        driver = self.acquire(timeout)
+        broken = False
+        try:
+            yield driver
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken=broken)
+    
+    def shutdown(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        with self._lock:
+            self._created = 0
+            self._uses.clear()
+    
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, 'size': self.size, 'alive': self._created, 'idle': self._idle.qsize()}
+
+BROWSER_POOL = BrowserPool()
+BROWSER_EXECUTOR = ThreadPoolExecutor(max_workers=BROWSER_POOL_SIZE, thread_name_prefix='browser')  # Async renders
+atexit.register(BROWSER_POOL.shutdown)
+
+HTML_BODY = re.compile(r'<body\b[^>]*>(.*?)(?:</body\s*>|\Z)', re.DOTALL | re.IGNORECASE)
+HTML_HIDDEN = re.compile(r'<!--.*?-->|<(script|style|noscript|template|head)\b.*?</\1\s*>', re.DOTALL | re.IGNORECASE)
+HTML_PRE = re.compile(r'<pre\b[^>]*>(.*?)</pre\s*>', re.DOTALL | re.IGNORECASE)
+HTML_BLOCK = re.compile(r'<br\s*/?>|</?(?:p|div|li|ul|ol|tr|table|h[1-6]|section|article|header|footer|nav|main|'
+                        r'blockquote|form|hr|dl|dt|dd|figure|figcaption)\b[^>]*>', re.IGNORECASE)
+HTML_CELL_END = re.compile(r'</t[dh]\s*>', re.IGNORECASE)
+HTML_TAG = re.compile(r'<[^>]+>')
+
+def html_to_text(html_content):
+    """Visible body text from server HTML, laid out like Selenium's body .text
+    
+    Blocks start new lines, inline tags add no space, runs of whitespace collapse
+    (except inside <pre>) and blank lines are dropped, so both fetch paths give the solver the same text.
+    """
+    body = HTML_BODY.search(html_content)
+    text = HTML_HIDDEN.sub('', body.group(1) if body else html_content)
+    
+    preformatted = []
+    def keep_pre(match):
+        preformatted.append(html_unescape(HTML_TAG.sub('', match.group(1))).strip('\n').replace('\xa0', ' '))
+        return f"\n\0{len(preformatted) - 1}\0\n"
+    text = HTML_PRE.sub(keep_pre, text)
+    
+    text = HTML_BLOCK.sub('\n', text)
+    text = HTML_CELL_END.sub(' ', text)
+    text = html_unescape(HTML_TAG.sub('', text)).replace('\xa0', ' ')
+    lines = []
+    for line in text.split('\n'):
+        line = re.sub(r'[ \t\r\f\v]+', ' ', line).strip()
+        if line.startswith('\0') and line.endswith('\0'):
+            line = preformatted[int(line.strip('\0'))]
+        if line:
+            lines.append(line)
+    return '\n'.join(lines)
+
+def time_left(deadline, cap):
+    """Timeout for a blocking call: cap, shortened to whatever is left before deadline"""
+    if deadline is None:
+        return cap
+    return max(0.1, min(cap, deadline - time.time()))
+
+def fetch_static_page(url, deadline=None):
+    """Fetch page over plain HTTP; return None if it needs JavaScript to render"""
+    try:
+        response = HTTP_SESSION.get(url, timeout=time_left(deadline, 15))
+        response.raise_for_status()
+    except Exception as e:
+        print(f"Static fetch failed: {e}")
+        return None
+    
+    if 'html' not in response.headers.get('Content-Type', 'text/html').lower():
+        return None
+    
+    html_content = response.text
+    if DYNAMIC_SCRIPT_PATTERN.search(html_content):
+        return None
+    
+    body_text = html_to_text(html_content)
+    # The visible text must already name where to submit - otherwise the page is still a shell
+    if not SUBMIT_URL_PATTERN.search(body_text):
+        return None
+    
+    return body_text, html_content
+
+def wait_for_page_ready(driver, timeout=PAGE_READY_TIMEOUT):
+    """Wait until the document is loaded and the body text stops changing"""
+    deadline = time.time() + timeout
+    last_text = None
+    while time.time() < deadline:
+        state, text = driver.execute_script(
+            "return [document.readyState, document.body ? document.body.innerText : ''];"
+        )
+        if state == 'complete' and text and text == last_text:
+            return True
+        last_text = text
+        time.sleep(PAGE_READY_POLL)
+    
+    print(f"⏳ Page not settled after {timeout:.0f}s, using current DOM")
+    return False
+
+def page_cache_key(url):
+    return f"page_{hashlib.md5(url.encode()).hexdigest()}"
+
+def fetch_quiz_page(url, deadline=None):
     """Fetch and render JavaScript-based quiz page"""
-    cache_key = f"page_{hashlib.md5(url.encode()).hexdigest()}"
-    if cache_key in CACHE:
+    return fetch_page_fast(url, deadline) or render_quiz_page(url, deadline)
+
+def fetch_page_fast(url, deadline=None):
+    """Cached page, or the server HTML when it already has the question; None if a browser is needed"""
+    cache_key = page_cache_key(url)
+    cached = CACHE.get(cache_key)
+    if cached is not None:
         print("↻ Using cached page")
-        return CACHE[cache_key]
+        return cached
     
-    driver = setup_browser()
+    # Fast path: skip the browser when the server HTML already has the question
+    if STATIC_FETCH_ENABLED:
+        page = fetch_static_page(url, deadline)
+        if page:
+            print("⚡ Static HTML fast path")
+            CACHE.set(cache_key, page, ttl=PAGE_CACHE_TTL)
+            return page
+    return None
+
+def render_quiz_page(url, deadline=None):
+    """Render the page in a pooled browser"""
+    cache_key = page_cache_key(url)
     try:
-        driver.get(url)
-        time.sleep(3)
-        html_content = driver.page_source
-        body_text = driver.find_element(By.TAG_NAME, "body").text
-        CACHE[cache_key] = (body_text, html_content)
+        with BROWSER_POOL.browser(time_left(deadline, BROWSER_CHECKOUT_TIMEOUT)) as driver:
+            driver.set_page_load_timeout(time_left(deadline, PAGE_LOAD_TIMEOUT))
+            driver.get(url)
+            wait_for_page_ready(driver, time_left(deadline, PAGE_READY_TIMEOUT))
+            html_content = driver.page_source
+            body_text = driver.find_element(By.TAG_NAME, "body").text
+        CACHE.set(cache_key, (body_text, html_content), ttl=PAGE_CACHE_TTL)
         return body_text, html_content
     except Exception as e:
         print(f"Error fetching page: {e}")
         return "", ""
-    finally:
-        driver.quit()
 
-def download_file(url):
+def create_http_session():
+    """Shared session: pooled keep-alive connections, compression, retries for idempotent calls"""
+    session = requests.Session()
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),  # Never retry POST submissions
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'User-Agent': 'Mozilla/5.0', 'Accept-Encoding': 'gzip, deflate'})
+    return session
+
+# requests.Session is safe to share across threads for plain get/post calls
+HTTP_SESSION = create_http_session()
+
+class ByteBudget:
+    """Blocking counter that caps how many file bytes are held at once"""
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self._cond = threading.Condition()
+    
+    def acquire(self, n):
+        n = min(n, self.max_bytes)  # A single oversized file still gets through alone
+        with self._cond:
+            while self.in_use and self.in_use + n > self.max_bytes:
+                self._cond.wait()
+            self.in_use += n
+        return n
+    
+    def release(self, n):
+        with self._cond:
+            self.in_use -= n
+            self._cond.notify_all()
+    
+    @contextmanager
+    def reserve(self, n):
+        """Hold n bytes; the yielded grow(total) raises the hold as a body turns out larger
+        
+        Growing never waits - a download already under way finishes - but later reservations see it.
+        """
+        held = self.acquire(n)
+        def grow(total):
+            nonlocal held
+            if total > held:
+                with self._cond:
+                    self.in_use += total - held
+                held = total
+        try:
+            yield grow
+        finally:
+            self.release(held)
+
+FILE_BYTES_BUDGET = ByteBudget(MAX_BYTES_IN_FLIGHT)
+FILE_EXECUTOR = ThreadPoolExecutor(max_workers=FILE_WORKERS, thread_name_prefix='file')
+
+def read_response_body(response, max_bytes=MAX_DOWNLOAD_BYTES, spill_threshold=SPILL_THRESHOLD, charge=None):
+    """Read a streamed response in chunks; bodies above spill_threshold go to a mapped temp file
+    
+    charge(total) is called with the bytes read so far, after each chunk.
+    """
+    expected = int(response.headers.get('Content-Length') or 0)
+    if expected > max_bytes:
+        response.close()
+        raise ValueError(f"File too large: {expected} bytes (limit {max_bytes})")
+    
+    buffer = bytearray()
+    spill = tempfile.TemporaryFile() if expected > spill_threshold else None
+    total = 0
+    try:
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            total += len(chunk)
+            if total > max_bytes:
+                raise ValueError(f"File too large: over {max_bytes} bytes")
+            if charge:
+                charge(total)
+            if spill is None and total > spill_threshold:
+                spill = tempfile.TemporaryFile()
+                spill.write(buffer)
+                buffer = None
+            if spill is not None:
+                spill.write(chunk)
+            else:
+                buffer += chunk
+    except Exception:
+        response.close()
+        if spill is not None:
+            spill.close()
+        raise
+    
+    if spill is not None:
+        if total == 0:
+            spill.close()
+            return b""
+        print(f"  → Spilled {total / 1024 / 1024:.1f} MB to mapped temp file")
+        return MappedContent(spill)
+    return bytes(buffer)
+
+def download_file(url, deadline=None):
     """Download file from URL with caching"""
     cache_key = f"file_{hashlib.md5(url.encode()).hexdigest()}"
-    if cache_key in CACHE:
+    cached = CACHE.get(cache_key)
+    if cached is not None:
         print(f"↻ Using cached file")
-        return CACHE[cache_key]
+        return cached
     
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    response = requests.get(url, headers=headers, timeout=30)
+    meta, stored = None, None
+    if DISK_CACHE:
+        meta = DISK_CACHE.url_meta(url)
+        stored = DISK_CACHE.get_blob(meta['sha256']) if meta else None
+        if stored is not None and time.time() - meta.get('validated_at', 0) < FILE_REVALIDATE_AFTER:
+            print(f"↻ Using file from disk cache")
+            CACHE.set(cache_key, stored)
+            return stored
+    
+    # Revalidate a stored copy instead of re-downloading it
+    headers = {}
+    if stored is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+    
+    response = HTTP_SESSION.get(url, headers=headers, timeout=time_left(deadline, 30), stream=True)
+    if response.status_code == 304 and stored is not None:
+        response.close()
+        print(f"↻ File unchanged (304), using disk cache")
+        DISK_CACHE.mark_validated(url, meta)
+        CACHE.set(cache_key, stored)
+        return stored
     response.raise_for_status()
-    CACHE[cache_key] = response.content
-    return response.content
+    # No Content-Length (chunked), or a gzip body larger than it: hold a spill's worth up front,
+    # then charge the budget for what actually arrives
+    expected = int(response.headers.get('Content-Length') or 0) or SPILL_THRESHOLD
+    with FILE_BYTES_BUDGET.reserve(expected) as grow:
+        content = read_response_body(response, charge=grow)
+    CACHE.set(cache_key, content)
+    if DISK_CACHE:
+        DISK_CACHE.put_url(url, content,
+                           etag=response.headers.get('ETag'),
+                           last_modified=response.headers.get('Last-Modified'))
+    return content
+
+def _extract_pdf_pages(pdf_bytes, page_numbers):
+    """Worker: extract text for the given 1-based pages (runs in a separate process)"""
+    reader = PyPDF2.PdfReader(BytesIO(pdf_bytes))
+    return {n: reader.pages[n - 1].extract_text() for n in page_numbers}
 
-def extract_pdf_text(pdf_content):
+_PDF_PROCESS_POOL = None
+_PDF_POOL_LOCK = threading.Lock()
+
+def get_pdf_process_pool():
+    """Process pool for large PDFs, created on first use"""
+    global _PDF_PROCESS_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_PROCESS_POOL is None:
+            # spawn: forking a process that runs Flask/Selenium threads can deadlock
+            _PDF_PROCESS_POOL = ProcessPoolExecutor(max_workers=PDF_PROCESS_WORKERS,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(_PDF_PROCESS_POOL.shutdown, wait=False)
+        return _PDF_PROCESS_POOL
+
+def reset_pdf_process_pool():
+    """Drop a broken pool so the next large PDF starts a fresh one"""
+    global _PDF_PROCESS_POOL
+    with _PDF_POOL_LOCK:
+        pool, _PDF_PROCESS_POOL = _PDF_PROCESS_POOL, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+def split_table_row(line):
+    cells = [c.strip() for c in re.split(r'\t|\s*\|\s*|\s{2,}', line.strip()) if c.strip()]
+    if len(cells) < 2:
+        cells = line.split()
+    return cells
+
+def _coerce_numeric(df):
+    for col in df.columns:
+        converted = pd.to_numeric(df[col].str.replace(r'[$,]', '', regex=True), errors='coerce')
+        if converted.notna().all():
+            df[col] = converted
+    return df
+
+class PdfDocument:
+    """Lazily extracted PDF: pages are parsed only when asked for and cached per (hash, page)"""
+    
+    def __init__(self, pdf_content):
+        self.content = pdf_content
+        self.digest = content_hash(pdf_content)
+        self._reader = None
+        self._lock = threading.Lock()
+    
+    @property
+    def reader(self):
+        with self._lock:
+            if self._reader is None:
+                self._reader = PyPDF2.PdfReader(open_stream(self.content))
+            return self._reader
+    
+    @property
+    def page_count(self):
+        return len(self.reader.pages)
+    
+    def _cache_key(self, page_number):
+        return f"pdfpage_{self.digest}_{page_number}"
+    
+    def _cached_page(self, page_number):
+        text = CACHE.get(self._cache_key(page_number))
+        if text is None and DISK_CACHE:
+            text = DISK_CACHE.get_parsed(self.digest, f"page{page_number}")
+            if text is not None:
+                CACHE.set(self._cache_key(page_number), text)
+        return text
+    
+    def _store_page(self, page_number, text):
+        CACHE.set(self._cache_key(page_number), text)
+        if DISK_CACHE:
+            DISK_CACHE.put_parsed(self.digest, f"page{page_number}", text)
+    
+    def page_text(self, page_number):
+        """Text of one 1-based page"""
+        text = self._cached_page(page_number)
+        if text is None:
+            text = self.reader.pages[page_number - 1].extract_text()
+            self._store_page(page_number, text)
+        return text
+    
+    def pages(self, page_numbers=None):
+        """{page: text} for the requested pages (all by default), in page order"""
+        count = self.page_count
+        if page_numbers is None:
+            page_numbers = range(1, count + 1)
+        page_numbers = sorted({n for n in page_numbers if 1 <= n <= count})
+        
+        result = {}
+        missing = []
+        for n in page_numbers:
+            text = self._cached_page(n)
+            if text is None:
+                missing.append(n)
+            else:
+                result[n] = text
+        
+        if len(missing) >= PDF_PARALLEL_MIN_PAGES:
+            result.update(self._extract_parallel(missing))
+        else:
+            for n in missing:
+                result[n] = self.page_text(n)
+        return {n: result[n] for n in page_numbers}
+    
+    def _extract_parallel(self, page_numbers):
+        pdf_bytes = bytes(as_buffer(self.content))
+        chunk = max(1, -(-len(page_numbers) // PDF_PROCESS_WORKERS))
+        batches = [page_numbers[i:i + chunk] for i in range(0, len(page_numbers), chunk)]
+        print(f"  → PDF: extracting {len(page_numbers)} pages in {len(batches)} processes")
+        try:
+            pool = get_pdf_process_pool()
+            futures = [pool.submit(_extract_pdf_pages, pdf_bytes, batch) for batch in batches]
+            texts = {}
+            for future in futures:
+                texts.update(future.result())
+        except Exception as e:
+            print(f"Parallel PDF extraction failed, falling back to serial: {e}")
+            reset_pdf_process_pool()
+            texts = {n: self.reader.pages[n - 1].extract_text() for n in page_numbers}
+        for n, text in texts.items():
+            self._store_page(n, text)
+        return texts
+    
+    def tables(self, page_number, min_rows=2):
+        """Tables on a page as DataFrames (first row is the header)"""
+        return text_tables(self.page_text(page_number) or "", min_rows)
+
+def text_tables(text, min_rows=2):
+    """Tables in extracted page text as DataFrames (first row is the header)
+    
+    A table is a run of consecutive lines that split into the same number of cells.
+    """
+    tables = []
+    run = []
+    for line in text.split('\n') + ['']:
+        cells = split_table_row(line) if line.strip() else []
+        if len(cells) >= 2 and (not run or len(cells) == len(run[0])):
+            run.append(cells)
+            continue
+        if len(run) > min_rows:
+            tables.append(_coerce_numeric(pd.DataFrame(run[1:], columns=run[0])))
+        run = [cells] if len(cells) >= 2 else []
+    return tables
+
+# Only a page reference tied to the document narrows extraction: "on page 2", "pages 3-5 of the PDF"
+PAGE_RANGE = r'pages?\s+(\d+)(?:\s*(?:-|to|and|&)\s*(\d+))?'
+PAGE_REFERENCES = [
+    re.compile(r'\b(?:on|from|in)\s+(?:the\s+)?' + PAGE_RANGE + r'\b(?!\s+of\s+(?:the\s+)?(?:quiz|site|website))',
+               re.IGNORECASE),
+    re.compile(r'\b' + PAGE_RANGE + r'\s+of\s+(?:the\s+|this\s+)?(?:pdf|document|report|file)\b', re.IGNORECASE),
+]
+
+def pages_mentioned(question):
+    """Pages of the PDF a question explicitly refers to (empty set = all)"""
+    pages = set()
+    matches = [m for pattern in PAGE_REFERENCES for m in pattern.findall(question)]
+    for start, end in matches:
+        start = int(start)
+        end = int(end) if end else start
+        if end - start > 200:
+            end = start
+        pages.update(range(start, end + 1))
+    return pages
+
+def extract_pdf_text(pdf_content, page_numbers=None):
     """Extract text from PDF"""
-    pdf_file = BytesIO(pdf_content)
-    pdf_reader = PyPDF2.PdfReader(pdf_file)
-    text_by_page = {}
-    for page_num in range(len(pdf_reader.pages)):
-        page = pdf_reader.pages[page_num]
-        text_by_page[page_num + 1] = page.extract_text()
-    return text_by_page
+    return PdfDocument(pdf_content).pages(page_numbers)
+
+def detect_encoding(content, sample_size=ENCODING_SAMPLE_BYTES):
+    """Pick a text encoding from the leading bytes instead of retrying whole-file parses"""
+    sample = bytes(as_buffer(content)[:sample_size])
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        if len(sample) == sample_size and e.start >= sample_size - 3:
+            return 'utf-8'  # Sample cut a multi-byte character in half
+        return 'latin-1'
+
+class CsvTable:
+    """CSV read in chunks: schema, per-column stats index and a sample; the full frame only for small files"""
+    
+    def __init__(self):
+        self.columns = []
+        self.dtypes = {}
+        self.rows = 0
+        self.stats = {}  # numeric column -> count, sum, min, max
+        self.value_counts = {}  # column -> Counter, for low-cardinality columns
+        self.head = None
+        self.tail = None
+        self.frame = None
+        self.encoding = None
+    
+    def add_chunk(self, chunk, numeric):
+        if self.head is None:
+            self.columns = list(chunk.columns)
+            self.dtypes = {c: str(t) for c, t in chunk.dtypes.items()}
+            self.stats = {c: {'count': 0, 'sum': 0, 'min': None, 'max': None} for c in numeric}
+            self.value_counts = {c: Counter() for c in chunk.columns}
+            self.head = chunk.head(CSV_SAMPLE_ROWS)
+        self.tail = chunk.tail(5)
+        self.rows += len(chunk)
+        
+        for col, stat in self.stats.items():
+            values = chunk[col].dropna()
+            if values.empty:
+                continue
+            total = values.sum()
+            stat['count'] += len(values)
+            stat['sum'] += int(total) if pd.api.types.is_integer_dtype(values) else float(total)
+            low, high = values.min(), values.max()
+            stat['min'] = low if stat['min'] is None else min(stat['min'], low)
+            stat['max'] = high if stat['max'] is None else max(stat['max'], high)
+        
+        for col in list(self.value_counts):
+            counts = chunk[col].value_counts()
+            self.value_counts[col].update(dict(zip(counts.index.tolist(), counts.tolist())))
+            if len(self.value_counts[col]) > CSV_MAX_DISTINCT:
+                del self.value_counts[col]  # High cardinality - not worth tracking
+    
+    def column(self, name):
+        """Actual column name for a case-insensitive name, or None"""
+        for col in self.columns:
+            if col.lower() == name.lower():
+                return col
+        return None
+    
+    @property
+    def numeric_columns(self):
+        return [c for c in self.columns if c in self.stats]
+    
+    def demote(self, col):
+        """A numeric column turned out to hold text: drop its stats rather than report wrong ones"""
+        print(f"⚠️ CSV column {col!r} has non-numeric values after row {self.rows} - no numeric stats for it")
+        del self.stats[col]
+        self.dtypes[col] = 'object'
+    
+    def mean(self, col):
+        stat = self.stats[col]
+        return stat['sum'] / stat['count'] if stat['count'] else None
+    
+    def summary(self):
+        lines = [f"{self.rows} rows; columns: " + ', '.join(f"{c} ({self.dtypes[c]})" for c in self.columns)]
+        for col in self.numeric_columns:
+            stat = self.stats[col]
+            lines.append(f"{col}: count={stat['count']} sum={stat['sum']} mean={self.mean(col)} "
+                         f"min={stat['min']} max={stat['max']}")
+        return '\n'.join(lines)
+    
+    def describe(self):
+        """Schema, column stats and a sample of rows"""
+        text = self.summary() + f"\nFirst rows:\n{self.head.to_string(index=False)}"
+        if self.rows > len(self.head):
+            text += f"\nLast rows:\n{self.tail.to_string(index=False)}"
+        return text
+
+def ingest_csv(csv_content, encoding, chunk_rows=CSV_CHUNK_ROWS):
+    """Stream the CSV once, building the stats index as chunks go by"""
+    table = CsvTable()
+    table.encoding = encoding
+    keep_frame = len(csv_content) <= CSV_FULL_FRAME_BYTES
+    frames = []
+    numeric = None
+    for chunk in pd.read_csv(open_stream(csv_content), encoding=encoding, chunksize=chunk_rows):
+        if numeric is None:
+            # Types come from the first chunk; later chunks must agree or the column is demoted
+            numeric = list(chunk.select_dtypes(include=['number']).columns)
+        else:
+            for col in table.numeric_columns:
+                if not pd.api.types.is_numeric_dtype(chunk[col]):
+                    coerced = pd.to_numeric(chunk[col], errors='coerce')
+                    if (coerced.isna() & chunk[col].notna()).any():
+                        table.demote(col)
+                    else:
+                        chunk[col] = coerced
+        table.add_chunk(chunk, numeric)
+        if keep_frame:
+            frames.append(chunk)
+    if numeric is None:
+        return None
+    if keep_frame:
+        table.frame = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    return table
 
 def parse_csv_data(csv_content):
-    """Parse CSV"""
+    """Parse CSV into a CsvTable"""
+    return cached_parse('csv_table', csv_content, _parse_csv_data)
+
+def _parse_csv_data(csv_content):
+    encoding = detect_encoding(csv_content)
     try:
-        return pd.read_csv(BytesIO(csv_content))
-    except:
+        return ingest_csv(csv_content, encoding)
+    except UnicodeDecodeError:
         try:
-            return pd.read_csv(BytesIO(csv_content), encoding='latin-1')
-        except:
+            return ingest_csv(csv_content, 'latin-1')
+        except Exception:
             return None
+    except Exception:
+        return None
 
-def analyze_image_color(image_content):
-    """Find most frequent color in image"""
+class PathStats:
+    """Index entry for one JSON key path"""
+    __slots__ = ('count', 'values', 'first', 'records')
+    
+    def __init__(self):
+        self.count = 0
+        # Keyed by (type, scalar) so True and 1, False and 0 stay apart
+        self.values = {}  # (type, scalar) -> occurrences; None once past JSON_MAX_DISTINCT
+        self.first = {}  # (type, scalar) -> record position of its first occurrence
+        self.records = array('q')
+    
+    def add_value(self, value, record):
+        values = self.values
+        if values is not None:
+            key = (value.__class__, value)
+            values[key] = values.get(key, 0) + 1
+            if key not in self.first:
+                self.first[key] = record
+            if len(values) > JSON_MAX_DISTINCT:
+                self.values = self.first = None  # High cardinality - not worth tracking
+
+class JsonDocument:
+    """Parsed JSON plus a path index: per key path, node count, value histogram and record positions
+    
+    Paths look like "tweets[].sentiment" ("[]" marks array items). A record position is the
+    item's index in its innermost array. A top-level array is decoded one record at a time,
+    and past JSON_FULL_BYTES only each record's offset is kept, so records decode on demand.
+    """
+    
+    def __init__(self, text, keep_chars=JSON_FULL_BYTES):
+        start = time.time()
+        text = text.lstrip('\ufeff \t\r\n')
+        self.chars = len(text)
+        self.preview = text[:JSON_CONTEXT_CHARS]
+        self.paths = {}
+        self.offsets = None
+        self._text = None
+        self._child_paths = {}  # path -> {key: child path}, so paths are not rebuilt per record
+        
+        if text.startswith('['):
+            self.offsets = array('q')
+            records = [] if len(text) <= keep_chars else None
+            for offset, item in self._stream_array(text):
+                self._index(item, '[]', len(self.offsets))
+                self.offsets.append(offset)
+                if records is not None:
+                    records.append(item)
+            self.data = records
+            if records is None:
+                self._text = text  # Records are decoded again from their offsets
+        else:
+            self.data = json.loads(text)
+            self._index(self.data, '', None)
+        print(f"  → JSON: {len(self.paths)} paths indexed in {time.time() - start:.2f}s")
+    
+    @staticmethod
+    def _stream_array(text):
+        """(offset, record) for each item of a top-level array; malformed input raises like json.loads"""
+        decoder = json.JSONDecoder()
+        space = re.compile(r'\s*')
+        pos = space.match(text, 1).end()
+        if text.startswith(']', pos):
+            pos += 1
+        else:
+            while True:
+                item, end = decoder.raw_decode(text, pos)
+                yield pos, item
+                pos = space.match(text, end).end()
+                if text.startswith(',', pos):
+                    pos = space.match(text, pos + 1).end()
+                elif text.startswith(']', pos):
+                    pos += 1
+                    break
+                else:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+        if space.match(text, pos).end() != len(text):
+            raise json.JSONDecodeError("Extra data", text, pos)
+    
+    def _entry(self, path):
+        entry = self.paths.get(path)
+        if entry is None:
+            entry = self.paths[path] = PathStats()
+        return entry
+    
+    def _index(self, value, path, record):
+        entry = self._entry(path)
+        entry.count += 1
+        if record is not None:
+            entry.records.append(record)
+        
+        if isinstance(value, dict):
+            names = self._child_paths.get(path)
+            if names is None:
+                names = self._child_paths[path] = {}
+            paths = self.paths
+            for key, item in value.items():
+                child = names.get(key)
+                if child is None:
+                    child = names[key] = f"{path}.{key}" if path else key
+                if isinstance(item, (dict, list)):
+                    self._index(item, child, record)
+                    continue
+                # Scalar leaf handled inline - this loop is the hot path
+                leaf = paths.get(child) or self._entry(child)
+                leaf.count += 1
+                if record is not None:
+                    leaf.records.append(record)
+                values = leaf.values
+                if values is not None:
+                    item = (item.__class__, item)
+                    values[item] = values.get(item, 0) + 1
+                    if item not in leaf.first:
+                        leaf.first[item] = record
+                    if len(values) > JSON_MAX_DISTINCT:
+                        leaf.values = leaf.first = None
+        elif isinstance(value, list):
+            for i, item in enumerate(value):
+                self._index(item, path + '[]', i)
+        else:
+            entry.add_value(value, record)
+    
+    def key_paths(self, key, in_array=True):
+        """Indexed paths ending in key, shortest first"""
+        suffix = '.' + key
+        paths = [p for p in self.paths if p == key or p.endswith(suffix)]
+        if in_array:
+            paths = [p for p in paths if '[]' in p]
+        return sorted(paths, key=len)
+    
+    def count_value(self, key, value):
+        """How many records have key == value, or None if the key is not indexed"""
+        for path in self.key_paths(key):
+            values = self.paths[path].values
+            if values is not None:
+                return values.get((value.__class__, value), 0)
+        return None
+    
+    def find_record(self, key, value):
+        """First record whose key == value, or None"""
+        for path in self.key_paths(key):
+            first = self.paths[path].first
+            key = (value.__class__, value)
+            if first and key in first and path.count('[]') == 1:
+                return self.record(path[:path.index('[]') + 2], first[key])
+        return None
+    
+    def first_value(self, key):
+        """First scalar value stored under key anywhere in the document"""
+        for path in self.key_paths(key, in_array=False):
+            first = self.paths[path].first
+            if first:
+                return next(iter(first))[1]
+        return None
+    
+    def record(self, array_path, i):
+        """Item i of the array at array_path ("[]" for the top-level array)"""
+        if array_path == '[]' and self.data is None:
+            return json.JSONDecoder().raw_decode(self._text, self.offsets[i])[0]
+        node = self.data
+        if array_path != '[]':
+            for key in array_path[:-2].split('.'):
+                node = node[key]
+        return node[i]
+    
+    def summary(self, max_paths=50, top_values=5):
+        lines = []
+        for path in sorted(self.paths)[:max_paths]:
+            entry = self.paths[path]
+            line = f"{path or '(root)'}: {entry.count}"
+            if entry.values:
+                top = sorted(entry.values.items(), key=lambda vn: -vn[1])[:top_values]
+                line += ' - ' + ', '.join(f"{v!r} ({n})" for (_, v), n in top)
+            lines.append(line)
+        if len(self.paths) > max_paths:
+            lines.append(f"... {len(self.paths) - max_paths} more paths")
+        return '\n'.join(lines)
+    
+    def describe(self):
+        """Path index plus the start of the document"""
+        return f"{self.summary()}\nFirst {min(2000, self.chars)} of {self.chars} chars:\n{self.preview[:2000]}"
+
+def parse_json_data(json_content):
+    """Decode JSON file and index its key paths"""
+    return cached_parse('json_index', json_content, lambda c: JsonDocument(c.decode('utf-8')))
+
+SQL_STATEMENT_END = re.compile(r';\s*$')
+SQL_TRANSACTION_CONTROL = re.compile(
+    r'^\s*(?:BEGIN(?:\s+(?:DEFERRED|IMMEDIATE|EXCLUSIVE))?(?:\s+TRANSACTION)?|START\s+TRANSACTION|'
+    r'(?:COMMIT|END|ROLLBACK)(?:\s+TRANSACTION)?)\s*;\s*$', re.IGNORECASE)
+MYSQL_ONLY = re.compile(r'^\s*(?:LOCK TABLES|UNLOCK TABLES|SET\s|/\*!)', re.IGNORECASE)
+MYSQL_TABLE_OPTIONS = re.compile(r'\)\s*(?:ENGINE|DEFAULT CHARSET|AUTO_INCREMENT)=[^;]*;', re.IGNORECASE)
+SQL_LOCAL_SCHEMAS = (None, 'main', 'temp')
+
+class SqlDatabase:
+    """A .sql dump loaded into an in-memory SQLite database"""
+    
+    def __init__(self, sql_text, batch_size=SQL_BATCH_STATEMENTS):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self.conn.set_authorizer(self._authorize)
+        self._lock = threading.Lock()
+        self.chars = len(sql_text)
+        self.statements = 0
+        self.skipped = 0
+        self.preview = sql_text[:SQL_CONTEXT_CHARS]
+        
+        start = time.time()
+        batch = []
+        for statement in self._statements(sql_text):
+            batch.append(statement)
+            if len(batch) >= batch_size:
+                self._load_batch(batch)
+                batch = []
+        if batch:
+            self._load_batch(batch)
+        
+        self.tables = {
+            name: [row[1] for row in self.conn.execute(f'PRAGMA table_info("{name}")')]
+            for (name,) in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        self.row_counts = {name: self.conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0] for name in self.tables}
+        page_count = self.conn.execute('PRAGMA page_count').fetchone()[0]
+        self.nbytes = page_count * self.conn.execute('PRAGMA page_size').fetchone()[0] + len(self.preview)
+        print(f"  → SQL: {self.statements} statements, {sum(self.row_counts.values())} rows "
+              f"in {len(self.tables)} table(s), {time.time() - start:.2f}s"
+              + (f" ({self.skipped} skipped)" if self.skipped else ""))
+    
+    @staticmethod
+    def _authorize(action, arg1, arg2, schema, trigger):
+        """Keep a remote dump inside this connection: no ATTACH/DETACH (VACUUM INTO attaches too), no other schemas"""
+        if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH) or schema not in SQL_LOCAL_SCHEMAS:
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+    
+    @staticmethod
+    def _statements(sql_text):
+        """Split a dump into single statements, line by line
+        
+        The dump's own transaction control is dropped - batches bring their own.
+        """
+        buffer = []
+        for line in sql_text.splitlines():
+            stripped = line.strip()
+            if not buffer and (not stripped or stripped.startswith('--')):
+                continue
+            buffer.append(line)
+            if SQL_STATEMENT_END.search(line):
+                text = '\n'.join(buffer)
+                if sqlite3.complete_statement(text):
+                    buffer = []
+                    for statement in SqlDatabase._split(text):
+                        if not MYSQL_ONLY.match(statement) and not SQL_TRANSACTION_CONTROL.match(statement):
+                            yield MYSQL_TABLE_OPTIONS.sub(');', statement)
+        if buffer:
+            yield '\n'.join(buffer) + ';'
+    
+    @staticmethod
+    def _split(text):
+        """Complete statements in text, cut at the semicolons that end one (not those in strings)"""
+        start = end = 0
+        while True:
+            end = text.find(';', end) + 1
+            if not end:
+                return
+            if sqlite3.complete_statement(text[start:end]):
+                statement = text[start:end].strip()
+                start = end
+                if statement != ';':
+                    yield statement
+    
+    def _load_batch(self, batch):
+        """Run a batch in one transaction; replay it statement by statement if any of it fails
+        
+        Batches hold no COMMIT of their own, so a failed batch rolls back whole and nothing is replayed twice.
+        """
+        try:
+            self.conn.executescript('BEGIN;\n' + '\n'.join(batch) + '\nCOMMIT;')
+            self.statements += len(batch)
+            return
+        except sqlite3.Error:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+        for statement in batch:
+            try:
+                self.conn.execute(statement)
+                self.statements += 1
+            except sqlite3.Error:
+                self.skipped += 1
+        self.conn.commit()
+    
+    def query(self, sql, params=(), deadline=None):
+        """Rows for sql; interrupted (sqlite3.OperationalError) once the deadline passes"""
+        with self._lock:
+            stop_at = time.time() + time_left(deadline, SQL_QUERY_TIMEOUT)
+            self.conn.set_progress_handler(lambda: time.time() > stop_at, SQL_PROGRESS_OPS)
+            try:
+                return self.conn.execute(sql, params).fetchall()
+            finally:
+                self.conn.set_progress_handler(None, 0)
+    
+    def answer(self, sql, params=(), deadline=None):
+        """Query result shaped as an answer: one cell, one column, or rows"""
+        rows = self.query(sql, params, deadline)
+        if not rows:
+            return None
+        if len(rows) == 1 and len(rows[0]) == 1:
+            value = rows[0][0]
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            return value
+        if all(len(row) == 1 for row in rows):
+            return [row[0] for row in rows]
+        return [list(row) for row in rows]
+    
+    def table_for(self, column):
+        """Tables that have a column of this name (case-insensitive)"""
+        column = column.lower()
+        return [t for t, cols in self.tables.items() if column in (c.lower() for c in cols)]
+    
+    def describe(self):
+        """Schema and row counts, plus the start of the dump"""
+        lines = [f"{name} ({self.row_counts[name]} rows): {', '.join(cols)}" for name, cols in self.tables.items()]
+        text = "Tables:\n" + '\n'.join(lines)
+        if self.chars > len(self.preview):
+            return f"{text}\nFirst {len(self.preview)} of {self.chars} chars:\n{self.preview}"
+        return f"{text}\n{self.preview}"
+
+SQL_DATABASES = LRUCache(max_bytes=SQL_CACHE_MAX_BYTES)
+
+def load_sql_database(sql_content):
+    """Load a dump into SQLite once per distinct content"""
+    digest = content_hash(sql_content)
+    db = SQL_DATABASES.get(digest)
+    if db is not None:
+        print("↻ Using loaded SQL database")
+        return db
+    db = SqlDatabase(sql_content.decode('utf-8', errors='replace'))
+    SQL_DATABASES.set(digest, db)
+    return db
+
+TEXT_TOKEN = re.compile(rb"[a-z\x80-\xff][a-z0-9'_\x80-\xff-]*")  # High bytes keep UTF-8 words whole
+ASCII_WHITESPACE = np.zeros(256, dtype=bool)
+ASCII_WHITESPACE[[9, 10, 11, 12, 13, 32]] = True
+TRAILING_WORD = re.compile(rb'\S*\Z')
+
+class TextFile:
+    """Counts, token frequencies and pattern counts from one pass over a text file
+    
+    Works on the downloaded buffer (memory-mapped for large files) a chunk at a time,
+    so no string of the whole file is ever built. Ad-hoc term counts take one more pass.
+    Files in other encodings are transcoded chunk by chunk, so every count sees UTF-8.
+    """
+    
+    def __init__(self, content, chunk_size=TEXT_CHUNK_BYTES):
+        self.content = content
+        self.chunk_size = chunk_size
+        buffer = as_buffer(content)
+        self.bytes = len(buffer)
+        self.encoding = detect_encoding(content)
+        self.preview = bytes(buffer[:TEXT_CONTEXT_CHARS]).decode(self.encoding, errors='ignore')
+        self.newlines = 0
+        self.words = 0
+        self.chars = 0
+        self.tokens = Counter()
+        self.tokens_exact = True
+        self.pattern_counts = dict.fromkeys(TEXT_PATTERNS, 0)
+        self._term_counts = {}
+        
+        start = time.time()
+        chunk = b''
+        for chunk in self.chunks():
+            self.newlines += chunk.count(b'\n')
+            codes = np.frombuffer(chunk, dtype=np.uint8)
+            space = ASCII_WHITESPACE[codes]
+            # A word starts at each non-space byte that follows a space (chunks start on a word)
+            self.words += int(np.count_nonzero(~space[1:] & space[:-1])) + int(len(codes) > 0 and not space[0])
+            self.chars += int(np.count_nonzero((codes & 0xC0) != 0x80))  # UTF-8 continuation bytes are not characters
+            self.tokens.update(TEXT_TOKEN.findall(chunk.lower()))
+            if len(self.tokens) > TEXT_MAX_VOCAB:
+                self.tokens = Counter(dict(self.tokens.most_common(TEXT_MAX_VOCAB // 2)))
+                self.tokens_exact = False
+            for name, (marker, pattern) in TEXT_PATTERNS.items():
+                if marker in chunk:
+                    self.pattern_counts[name] += len(pattern.findall(chunk))
+        
+        # Log levels are plain tokens, so the token counts already hold them
+        for level, tokens in TEXT_LOG_LEVELS.items():
+            self.pattern_counts[level] = sum(self.tokens[token] for token in tokens)
+        
+        # Lines as a reader counts them: a last line without a newline still counts
+        self.lines = self.newlines + (1 if chunk and not chunk.endswith(b'\n') else 0)
+        print(f"  → TEXT: {self.bytes} bytes, {self.lines} lines, {self.words} words in {time.time() - start:.2f}s")
+    
+    def _blocks(self, size):
+        """Raw blocks of the buffer as UTF-8, with a flag on the last one"""
+        buffer = as_buffer(self.content)
+        decoder = None
+        if self.encoding != 'utf-8':
+            decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        for start in range(0, self.bytes, size):
+            block = bytes(buffer[start:start + size])
+            last = start + size >= self.bytes
+            if decoder:
+                block = decoder.decode(block, final=last).encode('utf-8')
+            yield block, last
+    
+    def chunks(self):
+        """The file as UTF-8 chunks that end at a line break, or at whitespace inside very long lines"""
+        carry = b''
+        for block, last in self._blocks(self.chunk_size):
+            chunk = carry + block
+            carry = b''
+            if not last:
+                cut = chunk.rfind(b'\n') + 1 or TRAILING_WORD.search(chunk).start()
+                # No whitespace at all: keep growing the chunk rather than cut a word in two
+                chunk, carry = chunk[:cut], chunk[cut:]
+            if chunk:
+                yield chunk
+    
+    @staticmethod
+    def _term(term):
+        """Encoded term and whether to ignore case (smart case: any capital makes it exact)"""
+        return term.encode('utf-8'), term == term.lower()
+    
+    def count_lines(self, term):
+        """Lines containing term"""
+        key = ('lines', term)
+        if key not in self._term_counts:
+            needle, ignore_case = self._term(term)
+            pattern = re.compile(rb'^[^\n]*?' + re.escape(needle), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+            count = 0
+            line_counted = False  # Chunk ended mid-line on a line that already matched
+            for chunk in self.chunks():
+                starts = [match.start() for match in pattern.finditer(chunk)]
+                count += len(starts)
+                if line_counted and starts and starts[0] == 0:
+                    count -= 1
+                last_break = chunk.rfind(b'\n')
+                line_counted = not chunk.endswith(b'\n') and (
+                    bool(starts) and starts[-1] > last_break or line_counted and last_break < 0)
+            self._term_counts[key] = count
+        return self._term_counts[key]
+    
+    def count_matches(self, term):
+        """Occurrences of term"""
+        key = ('matches', term)
+        if key not in self._term_counts:
+            needle, ignore_case = self._term(term)
+            if ignore_case:
+                self._term_counts[key] = sum(chunk.lower().count(needle) for chunk in self.chunks())
+            else:
+                self._term_counts[key] = sum(chunk.count(needle) for chunk in self.chunks())
+        return self._term_counts[key]
+    
+    def top_tokens(self, n=10):
+        return [(token.decode('utf-8', errors='replace'), count) for token, count in self.tokens.most_common(n)]
+    
+    def summary(self):
+        top = ', '.join(f"{token} ({count})" for token, count in self.top_tokens())
+        patterns = ', '.join(f"{name}: {count}" for name, count in self.pattern_counts.items() if count)
+        return (f"{self.bytes} bytes, {self.chars} characters, {self.lines} lines, {self.words} words\n"
+                f"Top tokens{'' if self.tokens_exact else ' (approximate)'}: {top}\n"
+                f"Pattern counts: {patterns or 'none'}")
+    
+    def describe(self):
+        return f"{self.summary()}\nFirst {len(self.preview)} characters:\n{self.preview}"
+
+def rgb_to_hex(rgb):
+    return '#{:02x}{:02x}{:02x}'.format(int(rgb[0]), int(rgb[1]), int(rgb[2]))
+
+def _image_stats(image_content, max_pixels=None, palette_size=IMAGE_PALETTE_SIZE):
+    img = Image.open(open_stream(image_content)).convert('RGB')
+    width, height = img.size
+    max_pixels = IMAGE_MAX_PIXELS if max_pixels is None else max_pixels
+    sampled = bool(max_pixels) and width * height > max_pixels
+    if sampled:
+        # Nearest-neighbour keeps real colours; counts become approximate
+        factor = (width * height / max_pixels) ** 0.5
+        img = img.resize((max(1, int(width / factor)), max(1, int(height / factor))), Image.NEAREST)
+    
+    rgb = np.asarray(img, dtype=np.uint32).reshape(-1, 3)
+    packed = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+    colors, first_seen, counts = np.unique(packed, return_index=True, return_counts=True)
+    # Most frequent first; ties go to the colour seen first (same as Counter.most_common)
+    order = np.lexsort((first_seen, -counts))[:palette_size]
+    
+    return {
+        'width': width,
+        'height': height,
+        'pixels': width * height,
+        'sampled': sampled,
+        'unique_colors': int(len(colors)),
+        'dominant': '#{:06x}'.format(int(colors[order[0]])),
+        'mean': rgb_to_hex(np.rint(rgb.mean(axis=0))),
+        'palette': [('#{:06x}'.format(int(colors[i])), int(counts[i])) for i in order],
+        'histogram': {ch: np.bincount(rgb[:, i], minlength=256).tolist() for i, ch in enumerate('rgb')}
+    }
+
+def image_stats(image_content):
+    """Dominant colour, palette, mean colour, histogram and pixel counts in one vectorised pass"""
     try:
-        img = Image.open(BytesIO(image_content)).convert('RGB')
-        pixels = list(img.getdata())
-        most_common = Counter(pixels).most_common(1)[0][0]
-        return '#{:02x}{:02x}{:02x}'.format(most_common[0], most_common[1], most_common[2])
-    except:
+        return cached_parse('image', image_content, _image_stats)
+    except Exception as e:
+        print(f"Image error: {e}")
         return None
 
-def solve_with_advanced_logic(question, context):
-    """Enhanced logic solver - handles MORE patterns without API"""
+def analyze_image_color(image_content):
+    """Find most frequent color in image"""
+    stats = image_stats(image_content)
+    return stats['dominant'] if stats else None
+
+def as_matrix(vectors):
+    """2-D float array, one vector per row"""
+    return np.atleast_2d(np.asarray(vectors, dtype=np.float64))
+
+def normalize_rows(matrix):
+    """Rows scaled to unit length; zero rows stay zero"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms != 0)
+
+def cosine_similarity(a, b):
+    """Cosine of each row of a with the same row of b (one pair or n pairs at once)"""
+    a, b = as_matrix(a), as_matrix(b)
+    dots = np.einsum('ij,ij->i', a, b)
+    denom = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return np.divide(dots, denom, out=np.zeros_like(dots), where=denom != 0)
+
+def cosine_similarity_matrix(queries, corpus):
+    """All-pairs cosine, (m x d) against (n x d) -> (m x n), as one matrix product"""
+    return normalize_rows(as_matrix(queries)) @ normalize_rows(as_matrix(corpus)).T
+
+def top_k_similar(query, corpus, k=1):
+    """[(row, score)] for the k corpus rows closest to query, best first"""
+    scores = cosine_similarity_matrix(query, corpus)[0]
+    k = max(1, min(k, len(scores)))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return [(int(i), float(scores[i])) for i in best]
+
+NORMALIZED_KEYS = ('id', 'first_name', 'last_name', 'email')
+
+def normalize_columns(df):
+    """Map columns to id/first_name/last_name/email a whole column at a time
     
-    q_lower = question.lower()
-    full_text = question + "\n" + context
+    Same result as deciding value by value along each row (NaNs skipped, first/last
+    taken by the first column that fills them), with per-row state kept as masks.
+    """
+    n = len(df)
+    values = {key: np.empty(n, dtype=object) for key in NORMALIZED_KEYS}
+    present = {key: np.zeros(n, dtype=bool) for key in NORMALIZED_KEYS}
     
-    # 1. GitHub URL patterns
-    if "github" in q_lower or "repository" in q_lower:
-        # Look for username/repo pattern
-        match = re.search(r'repository\s+(\w+)/(\w+)', full_text, re.IGNORECASE)
-        if match:
-            return f"https://github.com/{match.group(1)}/{match.group(2)}"
-        # Direct URL
-        match = re.search(r'https://github\.com/[\w\-]+/[\w\-]+', full_text)
-        if match:
-            url = match.group(0)
-            # Avoid example URLs
-            if "username" not in url and "repo" not in url:
-                return url
-    
-    # 2. JSON extraction - multiple patterns
-    if "api_key" in q_lower or "extract" in q_lower or "key" in q_lower:
-        patterns = [
-            r'"api_key"\s*:\s*"([^"]+)"',
-            r'"key"\s*:\s*"([^"]+)"',
-            r'api_key["\']?\s*[:=]\s*["\']([^"\']+)',
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, context, re.IGNORECASE)
-            if match:
-                return match.group(1)
+    def assign(key, mask, column):
+        values[key][mask] = column[mask]
+        present[key] |= mask
+    
+    for col in df.columns:
+        col_lower = col.lower()
+        series = df[col]
+        column = series.to_numpy(dtype=object)
+        remaining = series.notna().to_numpy()
+        
+        if col_lower == 'id':
+            ids = np.empty(n, dtype=object)
+            ids[remaining] = pd.to_numeric(series[remaining]).astype('int64').tolist()
+            assign('id', remaining, ids)
+            continue
+        if 'first' in col_lower:
+            mask = remaining & ~present['first_name']
+            assign('first_name', mask, column)
+            remaining &= ~mask
+        if 'last' in col_lower:
+            mask = remaining & ~present['last_name']
+            assign('last_name', mask, column)
+            remaining &= ~mask
+        if 'email' in col_lower:
+            mask = remaining
+        else:
+            mask = remaining & series.astype(str).str.contains('@', regex=False).to_numpy()
+        assign('email', mask, column)
+        remaining &= ~mask
+        if 'name' in col_lower:
+            for key in ('first_name', 'last_name'):
+                mask = remaining & ~present[key]
+                assign(key, mask, column)
+                remaining &= ~mask
+    
+    # Sort by id (missing ids count as 0), keeping row order for ties
+    sort_keys = np.where(present['id'], values['id'], 0).astype(np.int64)
+    order = np.argsort(sort_keys, kind='stable')
+    keys = [key for key in NORMALIZED_KEYS if present[key].any()]
+    if not keys:
+        return [{} for _ in range(n)]
+    columns = [values[key][order] for key in keys]
+    masks = [present[key][order] for key in keys]
+    return [
+        {key: value for key, value, has in zip(keys, row, row_mask) if has}
+        for row, row_mask in zip(zip(*columns), zip(*masks))
+    ]
+
+class KeywordIndex:
+    """Finds every registered keyword occurring in a text in a single regex pass"""
+    
+    def __init__(self, keywords):
+        keywords = sorted(set(keywords), key=len, reverse=True)
+        # Lookahead so overlapping keywords are all seen; longest alternative wins at each position
+        self._pattern = re.compile('(?=(' + '|'.join(re.escape(k) for k in keywords) + '))') if keywords else None
+        # A match also implies every keyword that is a prefix of it ("github" -> "git")
+        self._implied = {k: [p for p in keywords if k.startswith(p)] for k in keywords}
+    
+    def find(self, text):
+        found = set()
+        if self._pattern is not None:
+            for match in self._pattern.finditer(text):
+                found.update(self._implied[match.group(1)])
+        return found
+
+class SolverRule:
+    """One logic rule: trigger keywords, precompiled patterns and its own counters"""
+    
+    def __init__(self, name, func, keywords=(), requires=None, patterns=None, generic=False):
+        self.name = name
+        self.func = func
+        self.keywords = tuple(keywords)
+        self.requires = requires
+        self.patterns = patterns or {}
+        self.generic = generic  # Broad fallback rule - low-confidence answer
+        self.calls = 0
+        self.hits = 0
+        self.errors = 0
+        self.total_time = 0.0
+    
+    def stats(self):
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'hits': self.hits,
+            'errors': self.errors,
+            'total_ms': round(self.total_time * 1000, 2),
+            'avg_ms': round(self.total_time * 1000 / self.calls, 3) if self.calls else 0.0
+        }
+
+class SolverInput:
+    """Question plus context; derived strings are only built when a rule needs them"""
+    
+    def __init__(self, question, ctx, deadline=None):
+        self.question = question
+        self.q_lower = question.lower()
+        self.ctx = ctx
+        self.deadline = deadline  # Rules that can run long (SQL) stop here
+    
+    @cached_property
+    def context(self):
+        return self.ctx.text
+    
+    @cached_property
+    def context_lower(self):
+        return self.context.lower()
+    
+    @cached_property
+    def full_text(self):
+        return self.question + "\n" + self.context
+    
+    @cached_property
+    def question_context(self):
+        return self.question + self.context
+
+# Registration order is priority order
+SOLVER_RULES = []
+_RULE_STATS_LOCK = threading.Lock()
+_RULE_INDEX = None
+
+def solver_rule(name, keywords=(), requires=None, patterns=None, generic=False):
+    """Register a logic rule. Rules with keywords only run if one occurs in the question."""
+    def register(func):
+        global _RULE_INDEX
+        SOLVER_RULES.append(SolverRule(name, func, keywords, requires, patterns, generic))
+        _RULE_INDEX = None
+        return func
+    return register
+
+def get_rule_index():
+    """(KeywordIndex, keyword -> rule positions, positions of keyword-less rules)"""
+    global _RULE_INDEX
+    index = _RULE_INDEX
+    if index is None:
+        by_keyword = {}
+        always = []
+        for pos, rule in enumerate(SOLVER_RULES):
+            if not rule.keywords:
+                always.append(pos)
+            for keyword in rule.keywords:
+                by_keyword.setdefault(keyword, []).append(pos)
+        index = _RULE_INDEX = (KeywordIndex(by_keyword), by_keyword, always)
+    return index
+
+def candidate_rules(inp):
+    """Rules worth running for this question, in priority order"""
+    keyword_index, by_keyword, always = get_rule_index()
+    positions = set(always)
+    for keyword in keyword_index.find(inp.q_lower):
+        positions.update(by_keyword[keyword])
+    rules = [SOLVER_RULES[pos] for pos in sorted(positions)]
+    return [r for r in rules if r.requires is None or r.requires(inp.ctx)]
+
+def solve_with_rules(question, context, deadline=None):
+    """Run candidate rules in order; returns (answer, rule) or (None, None)"""
+    ctx = QuizContext.from_text(context) if isinstance(context, str) else context
+    inp = SolverInput(question, ctx, deadline)
     
-    # 3. Unicode decoding - enhanced
-    if "unicode" in q_lower or r"\u" in question or r"\u" in context:
-        unicode_pattern = r'((?:\\u[0-9a-fA-F]{4})+)'
-        for text in [question, context]:
-            match = re.search(unicode_pattern, text)
+    for rule in candidate_rules(inp):
+        start = time.perf_counter()
+        error = False
+        try:
+            answer = rule.func(inp, rule.patterns)
+        except Exception as e:
+            print(f"{rule.name} rule error: {e}")
+            answer = None
+            error = True
+        elapsed = time.perf_counter() - start
+        
+        with _RULE_STATS_LOCK:
+            rule.calls += 1
+            rule.total_time += elapsed
+            rule.errors += error
+            rule.hits += answer is not None
+        
+        if answer is not None:
+            return answer, rule
+    return None, None
+
+def solve_with_advanced_logic(question, context, deadline=None):
+    """Enhanced logic solver - handles MORE patterns without API"""
+    answer, _ = solve_with_rules(question, context, deadline)
+    return answer
+
+def rule_stats():
+    with _RULE_STATS_LOCK:
+        return [rule.stats() for rule in SOLVER_RULES]
+
+# 1. GitHub URL patterns
+@solver_rule('github', keywords=['github', 'repository'], patterns={
+    'repo': re.compile(r'repository\s+(\w+)/(\w+)', re.IGNORECASE),
+    'url': re.compile(r'https://github\.com/[\w\-]+/[\w\-]+'),
+})
+def rule_github(inp, p):
+    # Look for username/repo pattern
+    match = p['repo'].search(inp.full_text)
+    if match:
+        return f"https://github.com/{match.group(1)}/{match.group(2)}"
+    # Direct URL
+    match = p['url'].search(inp.full_text)
+    if match:
+        url = match.group(0)
+        # Avoid example URLs
+        if "username" not in url and "repo" not in url:
+            return url
+
+# 2. JSON extraction - multiple patterns
+@solver_rule('json_key', keywords=['api_key', 'extract', 'key'], patterns={
+    'keys': [
+        re.compile(r'"api_key"\s*:\s*"([^"]+)"', re.IGNORECASE),
+        re.compile(r'"key"\s*:\s*"([^"]+)"', re.IGNORECASE),
+        re.compile(r'api_key["\']?\s*[:=]\s*["\']([^"\']+)', re.IGNORECASE),
+    ],
+})
+def rule_json_key(inp, p):
+    for pattern in p['keys']:
+        match = pattern.search(inp.context)
+        if match:
+            return match.group(1)
+    # Documents too large for the context are still in the path index
+    for doc in inp.ctx.of_kind('json'):
+        for key in ('api_key', 'key'):
+            value = doc.first_value(key)
+            if isinstance(value, str):
+                return value
+
+# 3. Unicode decoding - enhanced (also triggered by escapes in the data)
+@solver_rule('unicode', patterns={'escapes': re.compile(r'((?:\\u[0-9a-fA-F]{4})+)')})
+def rule_unicode(inp, p):
+    if "unicode" in inp.q_lower or r"\u" in inp.question or r"\u" in inp.context:
+        for text in [inp.question, inp.context]:
+            match = p['escapes'].search(text)
             if match:
                 try:
                     unicode_str = match.group(1)
@@ -168,459 +2215,1032 @@ def solve_with_advanced_logic(question, context):
                     return decoded
                 except:
                     pass
+
+# 4. Base64 decoding - enhanced
+@solver_rule('base64', keywords=['base64', 'decode'], patterns={
+    'blobs': [
+        re.compile(r'([A-Za-z0-9+/]{20,}={0,2})'),
+        re.compile(r'base64:\s*([A-Za-z0-9+/=]+)'),
+    ],
+})
+def rule_base64(inp, p):
+    for pattern in p['blobs']:
+        match = pattern.search(inp.question_context)
+        if match:
+            try:
+                decoded = base64.b64decode(match.group(1)).decode('utf-8')
+                return decoded
+            except:
+                pass
+
+# 5. Command construction - ENHANCED
+@solver_rule('command', keywords=['command', 'craft'], patterns={
+    'url': re.compile(r'(https?://[^\s<>"\']+?)(?:\.(?:\s|$)|\s)'),
+    'accept': re.compile(r'Accept:\s*([^\n\)]+)', re.IGNORECASE),
+    'email': re.compile(r'email[=:]([^\s&]+)'),
+    'txt_file': re.compile(r'(/[\w\-/]+\.txt)'),
+})
+def rule_command(inp, p):
+    q_lower = inp.q_lower
+    if "curl" in q_lower:
+        # Extract URL
+        url_match = p['url'].search(inp.full_text)
+        if url_match:
+            url = url_match.group(1).rstrip('.')
+            
+            # Check for headers
+            cmd = f"curl {url}"
+            
+            if "accept:" in q_lower or "header" in q_lower:
+                header_match = p['accept'].search(inp.full_text)
+                if header_match:
+                    header_val = header_match.group(1).strip()
+                    cmd += f' -H "Accept: {header_val}"'
+                elif "application/json" in q_lower:
+                    cmd += ' -H "Accept: application/json"'
+            
+            return cmd
     
-    # 4. Base64 decoding - enhanced
-    if "base64" in q_lower or "decode" in q_lower:
-        patterns = [
-            r'([A-Za-z0-9+/]{20,}={0,2})',
-            r'base64:\s*([A-Za-z0-9+/=]+)',
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, question + context)
-            if match:
-                try:
-                    decoded = base64.b64decode(match.group(1)).decode('utf-8')
-                    return decoded
-                except:
-                    pass
+    if "uv http" in q_lower:
+        email_match = p['email'].search(inp.full_text)
+        email = email_match.group(1) if email_match else EMAIL
+        if "accept: application/json" in q_lower:
+            return f'uv http get https://tds-llm-analysis.s-anand.net/project2/uv.json?email={email} -H "Accept: application/json"'
     
-    # 5. Command construction - ENHANCED
-    if "command" in q_lower or "craft" in q_lower:
-        if "curl" in q_lower:
-            # Extract URL
-            url_match = re.search(r'(https?://[^\s<>"\']+?)(?:\.(?:\s|$)|\s)', full_text)
-            if url_match:
-                url = url_match.group(1).rstrip('.')
-                
-                # Check for headers
-                cmd = f"curl {url}"
-                
-                if "accept:" in q_lower or "header" in q_lower:
-                    header_match = re.search(r'Accept:\s*([^\n\)]+)', full_text, re.IGNORECASE)
-                    if header_match:
-                        header_val = header_match.group(1).strip()
-                        cmd += f' -H "Accept: {header_val}"'
-                    elif "application/json" in q_lower:
-                        cmd += ' -H "Accept: application/json"'
-                
-                return cmd
-        
-        if "uv http" in q_lower:
-            email_match = re.search(r'email[=:]([^\s&]+)', full_text)
-            email = email_match.group(1) if email_match else EMAIL
-            if "accept: application/json" in q_lower:
-                return f'uv http get https://tds-llm-analysis.s-anand.net/project2/uv.json?email={email} -H "Accept: application/json"'
-        
-        if "wc -l" in q_lower or "line count" in q_lower:
-            file_match = re.search(r'(/[\w\-/]+\.txt)', full_text)
-            if file_match:
-                return f"wc -l {file_match.group(1)}"
-            return "wc -l /path/to/logs.txt"
-    
-    # 6. Git commands - expanded
-    if "git" in q_lower:
-        if "stage" in q_lower and "env.sample" in full_text:
-            return 'git add env.sample\ngit commit -m "chore: keep env sample"'
-        if "commit" in q_lower:
-            file_match = re.search(r'(\w+\.\w+)', question)
-            if file_match:
-                return f'git add {file_match.group(1)}\ngit commit -m "update file"'
-    
-    # 7. Docker commands
-    if "docker" in q_lower and "run" in q_lower:
-        if "requirements.txt" in q_lower or "pip install" in q_lower:
+    if "wc -l" in q_lower or "line count" in q_lower:
+        file_match = p['txt_file'].search(inp.full_text)
+        if file_match:
+            return f"wc -l {file_match.group(1)}"
+        return "wc -l /path/to/logs.txt"
+
+# 6. Git commands - expanded
+@solver_rule('git', keywords=['git'], patterns={'file': re.compile(r'(\w+\.\w+)')})
+def rule_git(inp, p):
+    if "stage" in inp.q_lower and "env.sample" in inp.full_text:
+        return 'git add env.sample\ngit commit -m "chore: keep env sample"'
+    if "commit" in inp.q_lower:
+        file_match = p['file'].search(inp.question)
+        if file_match:
+            return f'git add {file_match.group(1)}\ngit commit -m "update file"'
+
+# 7. Docker commands
+@solver_rule('docker', keywords=['docker'])
+def rule_docker(inp, p):
+    if "run" in inp.q_lower:
+        if "requirements.txt" in inp.q_lower or "pip install" in inp.q_lower:
             return "RUN pip install -r requirements.txt"
-    
-    # 8. GitHub Actions YAML
+
+# 8. GitHub Actions YAML
+@solver_rule('github_actions', keywords=['github actions', 'workflow'])
+def rule_github_actions(inp, p):
+    q_lower = inp.q_lower
     if "github actions" in q_lower or ("workflow" in q_lower and "yaml" in q_lower):
         if "npm test" in q_lower or "run" in q_lower:
             return """- name: Run tests
   run: npm test"""
-    
-    # 8. Markdown/path questions
-    if "markdown" in q_lower or "relative link" in q_lower or "path" in q_lower:
-        path_match = re.search(r'(/project2/[^\s<>"\']+\.md)', full_text)
-        if path_match:
-            return path_match.group(1)
-        if "data-preparation" in full_text:
-            return "/project2/data-preparation.md"
-    
-    # 9. CORS headers
-    if "cors" in q_lower or "access-control" in q_lower:
-        url_match = re.search(r'https://[^\s<>"\']+', full_text)
-        if url_match:
-            return f"Access-Control-Allow-Origin: {url_match.group(0)}"
-    
-    # 10. Table sum - SIMPLE approach: just add the 5 numbers shown
-    if ("sum" in q_lower or "total" in q_lower or "calculate" in q_lower) and ("table" in q_lower or "cost per unit" in q_lower or "product" in q_lower):
+
+# 8. Markdown/path questions
+@solver_rule('markdown_path', keywords=['markdown', 'relative link', 'path'], patterns={
+    'md_path': re.compile(r'(/project2/[^\s<>"\']+\.md)'),
+})
+def rule_markdown_path(inp, p):
+    path_match = p['md_path'].search(inp.full_text)
+    if path_match:
+        return path_match.group(1)
+    if "data-preparation" in inp.full_text:
+        return "/project2/data-preparation.md"
+
+# 9. CORS headers
+@solver_rule('cors', keywords=['cors', 'access-control'], patterns={'url': re.compile(r'https://[^\s<>"\']+')})
+def rule_cors(inp, p):
+    url_match = p['url'].search(inp.full_text)
+    if url_match:
+        return f"Access-Control-Allow-Origin: {url_match.group(0)}"
+
+# 10. Table sum - SIMPLE approach: just add the 5 numbers shown
+@solver_rule('table_sum', keywords=['sum', 'total', 'calculate'], patterns={'cost': re.compile(r'\$?\s*(\d+\.\d+)')})
+def rule_table_sum(inp, p):
+    q_lower = inp.q_lower
+    if "table" in q_lower or "cost per unit" in q_lower or "product" in q_lower:
         # Direct approach: 45.50 + 62.75 + 38.25 + 71.00 + 55.50 = 273
-        if "P001" in full_text and "P005" in full_text and "Component" in full_text:
+        if "P001" in inp.full_text and "P005" in inp.full_text and "Component" in inp.full_text:
             # Extract all decimal numbers from the question
-            costs = re.findall(r'\$?\s*(\d+\.\d+)', question)
+            costs = p['cost'].findall(inp.question)
             if len(costs) == 5:
                 total = sum(float(c) for c in costs)
                 return int(total) if total == int(total) else round(total, 2)
+
+# 11. CSV operations - answered from the column-stats index
+@solver_rule('csv', keywords=['sum', 'total', 'count', 'how many', 'average', 'mean', 'max', 'min'],
+             requires=lambda ctx: ctx.has('csv'))
+def rule_csv(inp, p):
+    q_lower = inp.q_lower
+    table = inp.ctx.first('csv')
+    if table is None:
+        return None
+    numeric_cols = table.numeric_columns
     
-    # 11. CSV operations - expanded
-    if "csv" in context.lower() or "dataframe" in context.lower():
-        try:
-            # Extract CSV data
-            csv_match = re.search(r'FULL CSV DATA:\n(.+?)(?:\n\n|$)', context, re.DOTALL)
-            if csv_match:
-                from io import StringIO
-                csv_data = csv_match.group(1)
-                
-                # Try reading with flexible separator
-                try:
-                    df = pd.read_csv(StringIO(csv_data), sep=r'\s+')
-                except:
-                    df = pd.read_csv(StringIO(csv_data))
-                
-                # Sum operations
-                if "sum" in q_lower or "total" in q_lower:
-                    # Look for amount/value column
-                    for col in ['amount', 'value', 'cost', 'price', 'total']:
-                        if col in [c.lower() for c in df.columns]:
-                            idx = [c.lower() for c in df.columns].index(col)
-                            col_name = df.columns[idx]
-                            return int(df[col_name].sum())
-                    # Fallback to first numeric column
-                    numeric_cols = df.select_dtypes(include=['number']).columns
-                    if len(numeric_cols) > 0:
-                        return int(df[numeric_cols[0]].sum())
-                
-                # Count operations
-                if "count" in q_lower or "how many" in q_lower:
-                    if "status" in q_lower and "200" in q_lower:
-                        # Count rows with status 200
-                        for col in df.columns:
-                            if 'status' in col.lower():
-                                return int((df[col] == 200).sum())
-                    return len(df)
-                
-                # Average/mean
-                if "average" in q_lower or "mean" in q_lower:
-                    numeric_cols = df.select_dtypes(include=['number']).columns
-                    if len(numeric_cols) > 0:
-                        return float(df[numeric_cols[0]].mean())
-                
-                # Max/min
-                if "maximum" in q_lower or "max" in q_lower:
-                    numeric_cols = df.select_dtypes(include=['number']).columns
-                    if len(numeric_cols) > 0:
-                        return int(df[numeric_cols[0]].max())
-                
-                if "minimum" in q_lower or "min" in q_lower:
-                    numeric_cols = df.select_dtypes(include=['number']).columns
-                    if len(numeric_cols) > 0:
-                        return int(df[numeric_cols[0]].min())
-        except Exception as e:
-            print(f"CSV logic error: {e}")
+    # Sum operations
+    if "sum" in q_lower or "total" in q_lower:
+        # Look for amount/value column
+        for name in ['amount', 'value', 'cost', 'price', 'total']:
+            col_name = table.column(name)
+            if col_name in table.stats:
+                return int(table.stats[col_name]['sum'])
+        # Fallback to first numeric column
+        if numeric_cols:
+            return int(table.stats[numeric_cols[0]]['sum'])
+    
+    # Count operations
+    if "count" in q_lower or "how many" in q_lower:
+        if "status" in q_lower and "200" in q_lower:
+            # Count rows with status 200 - never fall back to the total row count
+            for col in table.columns:
+                if 'status' not in col.lower():
+                    continue
+                if col in table.value_counts:
+                    counts = table.value_counts[col]
+                    return int(counts.get(200, 0) + counts.get('200', 0))
+                if table.frame is not None:
+                    return int((pd.to_numeric(table.frame[col], errors='coerce') == 200).sum())
+            return None
+        return table.rows
+    
+    # Average/mean
+    if "average" in q_lower or "mean" in q_lower:
+        if numeric_cols:
+            return float(table.mean(numeric_cols[0]))
     
-    # 12. Image color
-    if "color" in q_lower or "hex" in q_lower or "rgb" in q_lower:
-        match = re.search(r'#([0-9a-f]{6})', context, re.IGNORECASE)
+    # Max/min
+    if "maximum" in q_lower or "max" in q_lower:
+        if numeric_cols:
+            return int(table.stats[numeric_cols[0]]['max'])
+    
+    if "minimum" in q_lower or "min" in q_lower:
+        if numeric_cols:
+            return int(table.stats[numeric_cols[0]]['min'])
+
+# PDF tables - aggregate a named column of a line-aligned table on the extracted pages
+@solver_rule('pdf_table', keywords=['sum', 'total', 'average', 'mean', 'max', 'min', 'table'],
+             requires=lambda ctx: ctx.has('pdf'), patterns={
+    'sum': re.compile(r'\b(?:sum|total)\b'),
+    'mean': re.compile(r'\b(?:average|mean)\b'),
+    'max': re.compile(r'\b(?:max|maximum|highest|largest)\b'),
+    'min': re.compile(r'\b(?:min|minimum|lowest|smallest)\b'),
+})
+def rule_pdf_table(inp, p):
+    q_lower = inp.q_lower
+    columns = []  # (column name, values), longest name first so "unit price" beats "price"
+    for text in inp.ctx.first('pdf').values():
+        for table in text_tables(text or ""):
+            for col in table.columns:
+                name = str(col).lower()
+                if pd.api.types.is_numeric_dtype(table[col]) and re.search(r'\b' + re.escape(name) + r'\b', q_lower):
+                    columns.append((name, table[col]))
+    if not columns:
+        return None
+    values = max(columns, key=lambda c: len(c[0]))[1]
+    
+    # Whole words only: "determine" is a lookup, not a minimum
+    aggregate = next((name for name in ('sum', 'mean', 'max', 'min') if p[name].search(q_lower)), None)
+    if aggregate is None:
+        return None
+    result = float(getattr(values, aggregate)())
+    return int(result) if result.is_integer() else round(result, 2)
+
+# 12. Image color
+@solver_rule('image_color', keywords=['color', 'colour', 'hex', 'rgb', 'pixel'], patterns={
+    'unique': re.compile(r'unique colors: (\d+)'),
+    'pixels': re.compile(r'Image size: \d+x\d+, pixels: (\d+)'),
+    'mean': re.compile(r'Image mean color: (#[0-9a-f]{6})'),
+    'hex': re.compile(r'#([0-9a-f]{6})', re.IGNORECASE),
+})
+def rule_image_color(inp, p):
+    q_lower = inp.q_lower
+    if "unique" in q_lower or "distinct" in q_lower:
+        match = p['unique'].search(inp.context)
         if match:
-            return f"#{match.group(1)}"
+            return int(match.group(1))
+    if "how many pixels" in q_lower or "pixel count" in q_lower or "number of pixels" in q_lower:
+        match = p['pixels'].search(inp.context)
+        if match:
+            return int(match.group(1))
+    if "mean" in q_lower or "average" in q_lower:
+        match = p['mean'].search(inp.context)
+        if match:
+            return match.group(1)
+    match = p['hex'].search(inp.context)
+    if match:
+        return f"#{match.group(1)}"
+
+# 13. JSON normalization - FIXED column mapping
+@solver_rule('json_normalize', keywords=['normalize'], requires=lambda ctx: ctx.has('csv'))
+def rule_json_normalize(inp, p):
+    if "json" not in inp.q_lower:
+        return None
+    df = inp.ctx.first('csv').frame
+    if df is None:
+        return None  # Too large to hold as rows
+    # Expected output: id, first_name, last_name, email
+    # The CSV likely has columns like: id, first, name, last, name, email
+    # We need to map them correctly
+    return normalize_columns(df)
+
+# 14. JSON analysis - FIXED to look in context properly
+@solver_rule('json_analysis', keywords=['count', 'find', 'identify', 'sentiment', 'cosine', 'similar'],
+             requires=lambda ctx: ctx.has('json'), patterns={'top_k': re.compile(r'\btop[\s-]*(\d+)')})
+def rule_json_analysis(inp, p):
+    q_lower = inp.q_lower
+    doc = inp.ctx.first('json')
+    if doc is None:
+        return None
+    json_data = doc.data
+    
+    # Cosine similarity calculation
+    if "cosine" in q_lower or "similar" in q_lower:
+        if isinstance(json_data, dict):
+            # Look for embedding1 and embedding2
+            emb1 = json_data.get('embedding1') or json_data.get('embeddings', {}).get('embedding1')
+            emb2 = json_data.get('embedding2') or json_data.get('embeddings', {}).get('embedding2')
+            
+            if emb1 and emb2:
+                return round(float(cosine_similarity(emb1, emb2)[0]), 3)
+        
+        # Many vectors: rank them all against the query in one matrix product
+        query, labels, corpus = embedding_search_space(json_data)
+        if query is not None and labels:
+            match = p['top_k'].search(q_lower)
+            ranked = top_k_similar(query, corpus, int(match.group(1)) if match else 1)
+            if match:
+                return [labels[i] for i, _ in ranked]
+            return labels[ranked[0][0]]
+    
+    # Counts and lookups come from the path index, whatever the records are nested under
+    # Count tweets with positive sentiment
+    if "sentiment" in q_lower and "positive" in q_lower:
+        count = doc.count_value('sentiment', 'positive')
+        if count is not None:
+            return count
+    
+    # Count with status 200
+    if "status" in q_lower and "200" in q_lower:
+        count = doc.count_value('status', 200)
+        if count is not None:
+            return count
+    
+    # Find compression type
+    if "gzip" in q_lower or "compression" in q_lower:
+        item = doc.find_record('compression', 'gzip')
+        if isinstance(item, dict):
+            # Return request ID
+            return item.get('id') or item.get('request_id') or item.get('req_id')
+
+EMBEDDING_KEYS = ('embedding', 'vector', 'embeddings')
+QUERY_KEYS = ('query', 'query_embedding', 'target', 'target_embedding', 'question')
+
+def embedding_search_space(data):
+    """(query vector, labels, corpus matrix) from a JSON document of embeddings, or (None, None, None)"""
+    if not isinstance(data, dict):
+        return None, None, None
+    query = next((data[k] for k in QUERY_KEYS if isinstance(data.get(k), list)), None)
+    if isinstance(query, list) and query and isinstance(query[0], list):
+        query = None  # A list of vectors, not a single query
+    labels, vectors = [], []
+    for key, value in data.items():
+        if key in QUERY_KEYS:
+            continue
+        if isinstance(value, dict):  # {"doc_a": [...], "doc_b": [...]}
+            items = [(k, v) for k, v in value.items() if isinstance(v, list)]
+        elif isinstance(value, list) and value and isinstance(value[0], dict):  # [{"id": .., "embedding": [..]}]
+            items = []
+            for i, record in enumerate(value):
+                vector = next((record[k] for k in EMBEDDING_KEYS if isinstance(record.get(k), list)), None)
+                label = record.get('id', record.get('name', record.get('text', i)))
+                if vector is not None:
+                    items.append((label, vector))
+        else:
+            continue
+        if items:
+            labels, vectors = [label for label, _ in items], [vector for _, vector in items]
+            break
+    if query is None or not vectors:
+        return None, None, None
+    return query, labels, as_matrix(vectors)
+
+# 15. SQL questions - run real queries against the loaded dump
+SQL_AGGREGATES = [
+    ('SUM', ('sum', 'total')),
+    ('AVG', ('average', 'mean')),
+    ('MAX', ('maximum', 'highest', 'largest', 'max')),
+    ('MIN', ('minimum', 'lowest', 'smallest', 'min')),
+]
+SQL_VERBAL_OPERATORS = {
+    'greater than': '>', 'more than': '>', 'over': '>', 'above': '>', 'older than': '>',
+    'less than': '<', 'fewer than': '<', 'under': '<', 'below': '<', 'younger than': '<',
+    'at least': '>=', 'at most': '<=', 'equal to': '=', 'equals': '=', 'is': '=',
+}
+
+@solver_rule('sql', keywords=['sql', 'database', 'sqlite', 'query', 'select', 'how many', 'count',
+                              'sum', 'total', 'average', 'mean', 'max', 'min'],
+             requires=lambda ctx: ctx.has('sql'), patterns={
+    'select': re.compile(r'\b(SELECT\s.+?)(?:;|\n\s*\n|$)', re.IGNORECASE | re.DOTALL),
+    'condition': re.compile(r'\b(\w+)\s*(>=|<=|!=|<>|=|>|<)\s*(\'[^\']*\'|"[^"]*"|-?\d+(?:\.\d+)?)'),
+    'verbal': re.compile(r'\b(\w+)\s+(?:is\s+)?(' + '|'.join(sorted(SQL_VERBAL_OPERATORS, key=len, reverse=True))
+                         + r')\s+(-?\d+(?:\.\d+)?)\b', re.IGNORECASE),
+    'word': re.compile(r'\w+'),
+})
+def rule_sql(inp, p):
+    db = inp.ctx.first('sql')
+    if db is None:
+        return None
     
-    # 13. JSON normalization - FIXED column mapping
-    if "normalize" in q_lower and "json" in q_lower:
+    # A query spelled out in the question runs as-is
+    match = p['select'].search(inp.question)
+    if match:
         try:
-            csv_match = re.search(r'FULL CSV DATA:\n(.+?)(?:\n\n|$)', context, re.DOTALL)
-            if csv_match:
-                from io import StringIO
-                csv_data = csv_match.group(1)
-                
-                # Read CSV properly
-                try:
-                    df = pd.read_csv(StringIO(csv_data), sep=r'\s+')
-                except:
-                    try:
-                        df = pd.read_csv(StringIO(csv_data))
-                    except:
-                        df = pd.read_csv(StringIO(csv_data), sep=',')
-                
-                # Expected output: id, first_name, last_name, email
-                # The CSV likely has columns like: id, first, name, last, name, email
-                # We need to map them correctly
-                
-                result = []
-                for _, row in df.iterrows():
-                    item = {}
-                    
-                    # Map columns intelligently
-                    for col in df.columns:
-                        col_lower = col.lower()
-                        val = row[col]
-                        
-                        # Skip NaN values
-                        if pd.isna(val):
-                            continue
-                        
-                        # Map to expected keys
-                        if col_lower == 'id':
-                            item['id'] = int(val)
-                        elif 'first' in col_lower and 'first_name' not in item:
-                            item['first_name'] = val
-                        elif 'last' in col_lower and 'last_name' not in item:
-                            item['last_name'] = val
-                        elif 'email' in col_lower or '@' in str(val):
-                            item['email'] = val
-                        elif 'name' in col_lower:
-                            # Decide if it's first_name or last_name based on what we have
-                            if 'first_name' not in item:
-                                item['first_name'] = val
-                            elif 'last_name' not in item:
-                                item['last_name'] = val
-                    
-                    result.append(item)
-                
-                # Sort by id
-                result = sorted(result, key=lambda x: x.get('id', 0))
-                
-                return result
-        except Exception as e:
-            print(f"JSON normalization error: {e}")
+            answer = db.answer(match.group(1), deadline=inp.deadline)
+            if answer is not None:
+                return answer
+        except sqlite3.Error as e:
+            print(f"  → SQL query failed ({e}), trying the question text")
+    
+    query = build_sql_query(inp.question, db, p)
+    if query:
+        sql, params = query
+        print(f"  → SQL: {sql} {params}")
+        return db.answer(sql, params, inp.deadline)
+
+def build_sql_query(question, db, p):
+    """Count/sum/avg/min/max with simple filters, over one table or two joined on an id column"""
+    q_lower = question.lower()
+    conditions = []
+    for column, op, value in p['condition'].findall(question) + p['verbal'].findall(question):
+        tables = db.table_for(column)
+        if not tables:
+            continue
+        op = SQL_VERBAL_OPERATORS.get(op.lower(), op)
+        if value[:1] in '\'"':
+            value = value[1:-1]
+        else:
+            value = float(value) if '.' in value else int(value)
+        conditions.append((tables[0], column, '!=' if op == '<>' else op, value))
+    
+    aggregate, target = None, None
+    for func, words in SQL_AGGREGATES:
+        for word in words:
+            match = re.search(rf'\b{word}\b(?:\s+(?:of|the|all))*\s+(\w+)', q_lower)
+            if match and db.table_for(match.group(1)):
+                aggregate, target = func, match.group(1)
+                break
+        if aggregate:
+            break
+    words = set(p['word'].findall(q_lower))
+    counting = any(w in q_lower for w in ('how many', 'count', 'number of'))
+    other_aggregate = any(w in words for _, ws in SQL_AGGREGATES for w in ws)
+    named = [t for t in db.tables if t.lower() in words or t.lower().rstrip('s') in words]
+    # A plain "how many users" counts the named table
+    if aggregate is None and not (conditions and (counting or not other_aggregate)) and not (counting and named):
+        return None
+    
+    # Main table: the one being aggregated, else one named in the question, else the filtered one
+    if target:
+        main = db.table_for(target)[0]
+    elif named:
+        main = named[0]
+    elif conditions:
+        main = conditions[0][0]
+    else:
+        return None
+    
+    joins = {}
+    for table, *_ in conditions:
+        if table != main and table not in joins:
+            on = sql_join_condition(db, main, table)
+            if on is None:
+                return None
+            joins[table] = on
+    
+    select = f'{aggregate}("{main}"."{target}")' if aggregate else 'COUNT(*)'
+    sql = f'SELECT {select} FROM "{main}"'
+    for table, on in joins.items():
+        sql += f' JOIN "{table}" ON {on}'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(f'"{t}"."{c}" {op} ?' for t, c, op, _ in conditions)
+    return sql, [value for *_, value in conditions]
+
+def sql_join_condition(db, left, right):
+    """Join on <table>_id = <table>.id in either direction, else on a shared *_id column"""
+    left_cols = {c.lower(): c for c in db.tables[left]}
+    right_cols = {c.lower(): c for c in db.tables[right]}
+    for a, a_cols, b, b_cols in ((left, left_cols, right, right_cols), (right, right_cols, left, left_cols)):
+        for key in (f"{b.lower().rstrip('s')}_id", f"{b.lower()}_id"):
+            if key in a_cols and 'id' in b_cols:
+                return f'"{a}"."{a_cols[key]}" = "{b}"."{b_cols["id"]}"'
+    for key in left_cols:
+        if key.endswith('_id') and key in right_cols:
+            return f'"{left}"."{left_cols[key]}" = "{right}"."{right_cols[key]}"'
+    return None
+
+def text_term(question, p):
+    """Term a text question asks about: a quoted one first, then "the word X", then contains X"""
+    quoted = p['quoted'].search(question)
+    if quoted:
+        return quoted.group(1) or quoted.group(2)
+    for key in ('named', 'term'):
+        match = p[key].search(question)
+        if match:
+            return next(group for group in match.groups() if group)
+    return None
+
+# Text files - counts come from the one-pass stats, terms from one more scan
+@solver_rule('text_stats', keywords=['line', 'word', 'byte', 'character', 'frequent', 'common', 'occurrence',
+                                     'times', 'appear', 'wc'],
+             requires=lambda ctx: ctx.has('text'), patterns={
+    'quoted': re.compile(r'(?<!\w)"([^"]+)"(?!\w)|(?<!\w)\'([^\']+)\'(?!\w)'),
+    'named': re.compile(r'\bthe\s+(?:word|string|term|token|text)\s+([^\s?,]+)', re.IGNORECASE),
+    'term': re.compile(r'\b(?:contain(?:s|ing)?|mention(?:s|ing)?|occurrences? of)\s+([^\s?,]+)'
+                       r'|\bdoes\s+(?!the\b|it\b|this\b)([^\s?,]+)\s+(?:appear|occur)', re.IGNORECASE),
+    'top_n': re.compile(r'\btop[\s-]*(\d+)'),
+})
+def rule_text_stats(inp, p):
+    text = inp.ctx.first('text')
+    q_lower = inp.q_lower
+    term = text_term(inp.question, p)
+    
+    if term and "line" in q_lower and ("contain" in q_lower or "mention" in q_lower):
+        return text.count_lines(term)
+    if term and ("times" in q_lower or "occurrence" in q_lower or "appear" in q_lower):
+        return text.count_matches(term)
+    
+    if "frequent" in q_lower or "most common" in q_lower:
+        top_n = p['top_n'].search(q_lower)
+        top = text.top_tokens(int(top_n.group(1)) if top_n else 1)
+        if top:
+            return [token for token, _ in top] if top_n else top[0][0]
+    
+    if "wc -l" in q_lower:
+        return text.newlines  # wc counts newline characters
+    if "how many lines" in q_lower or "line count" in q_lower or "number of lines" in q_lower:
+        return text.lines
+    if "how many words" in q_lower or "word count" in q_lower or "number of words" in q_lower:
+        return text.words
+    if "how many bytes" in q_lower or "size in bytes" in q_lower or "byte count" in q_lower:
+        return text.bytes
+    if "how many characters" in q_lower or "character count" in q_lower or "number of characters" in q_lower:
+        return text.chars
+
+@solver_rule('number', keywords=['number', 'value'], generic=True, patterns={
+    'number': re.compile(r'\b\d+(?:\.\d+)?\b'),
+})
+def rule_number(inp, p):
+    if "first" not in inp.q_lower and "last" not in inp.q_lower:
+        return None
+    numbers = p['number'].findall(inp.question_context)
+    if numbers:
+        if "first" in inp.q_lower:
+            return float(numbers[0]) if '.' in numbers[0] else int(numbers[0])
+        if "last" in inp.q_lower:
+            return float(numbers[-1]) if '.' in numbers[-1] else int(numbers[-1])
+
+# 12. Boolean questions
+@solver_rule('boolean', keywords=['is', 'does', 'can'], generic=True)
+def rule_boolean(inp, p):
+    context_lower = inp.context_lower
+    if "yes" in context_lower or "true" in context_lower:
+        return True
+    if "no" in context_lower or "false" in context_lower:
+        return False
+
+# 13. List/array operations
+@solver_rule('list', keywords=['list', 'array'], generic=True, patterns={
+    'array': re.compile(r'\[.*\]', re.DOTALL),
+})
+def rule_list(inp, p):
+    # Extract JSON arrays
+    try:
+        json_match = p['array'].search(inp.context)
+        if json_match:
+            arr = json.loads(json_match.group(0))
+            if "length" in inp.q_lower or "count" in inp.q_lower:
+                return len(arr)
+            if "first" in inp.q_lower:
+                return arr[0]
+            if "last" in inp.q_lower:
+                return arr[-1]
+    except:
+        pass
+
+# 14. Text extraction
+@solver_rule('quoted_text', keywords=['text', 'string', 'extract'], generic=True, patterns={
+    'quoted': re.compile(r'"([^"]+)"'),
+})
+def rule_quoted_text(inp, p):
+    # Look for quoted strings
+    match = p['quoted'].search(inp.context)
+    if match:
+        return match.group(1)
+
+# 15. URL extraction
+@solver_rule('url', keywords=['url'], generic=True, patterns={'url': re.compile(r'https?://[^\s<>"\']+')})
+def rule_url(inp, p):
+    match = p['url'].search(inp.question_context)
+    if match:
+        return match.group(0)
+
+# 16. Email extraction
+@solver_rule('email', keywords=['email'], generic=True, patterns={
+    'email': re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'),
+})
+def rule_email(inp, p):
+    match = p['email'].search(inp.question_context)
+    if match:
+        return match.group(0)
+
+# 17. Date extraction
+@solver_rule('date', keywords=['date'], generic=True, patterns={
+    'dates': [
+        re.compile(r'\d{4}-\d{2}-\d{2}'),
+        re.compile(r'\d{2}/\d{2}/\d{4}'),
+        re.compile(r'\d{2}-\d{2}-\d{4}'),
+    ],
+})
+def rule_date(inp, p):
+    for pattern in p['dates']:
+        match = pattern.search(inp.context)
+        if match:
+            return match.group(0)
+
+class TokenBucketLimiter:
+    """Token bucket (GCRA) over RATE_STATE, shared by all threads and worker processes
     
-    # 14. JSON analysis - FIXED to look in context properly
-    if "json" in context.lower() and ("count" in q_lower or "find" in q_lower or "identify" in q_lower or "sentiment" in q_lower or "cosine" in q_lower or "similarity" in q_lower):
-        try:
-            json_match = re.search(r'JSON DATA:\n(.+?)(?:\n\n|$)', context, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-                json_data = json.loads(json_str)
-                
-                # Cosine similarity calculation
-                if "cosine" in q_lower or "similarity" in q_lower:
-                    if isinstance(json_data, dict):
-                        # Look for embedding1 and embedding2
-                        emb1 = json_data.get('embedding1') or json_data.get('embeddings', {}).get('embedding1')
-                        emb2 = json_data.get('embedding2') or json_data.get('embeddings', {}).get('embedding2')
-                        
-                        if emb1 and emb2:
-                            import math
-                            # Dot product
-                            dot_product = sum(a * b for a, b in zip(emb1, emb2))
-                            # Magnitudes
-                            mag1 = math.sqrt(sum(a * a for a in emb1))
-                            mag2 = math.sqrt(sum(b * b for b in emb2))
-                            # Cosine similarity
-                            similarity = dot_product / (mag1 * mag2)
-                            return round(similarity, 3)
-                
-                # Count tweets with positive sentiment
-                if "sentiment" in q_lower and "positive" in q_lower:
-                    if isinstance(json_data, list):
-                        count = sum(1 for item in json_data if isinstance(item, dict) and item.get('sentiment') == 'positive')
-                        return count
-                    elif isinstance(json_data, dict) and 'tweets' in json_data:
-                        count = sum(1 for item in json_data['tweets'] if item.get('sentiment') == 'positive')
-                        return count
-                
-                # Count with status 200
-                if "status" in q_lower and "200" in q_lower:
-                    if isinstance(json_data, list):
-                        count = sum(1 for item in json_data if isinstance(item, dict) and item.get('status') == 200)
-                        return count
-                    elif isinstance(json_data, dict) and 'endpoints' in json_data:
-                        count = sum(1 for item in json_data['endpoints'] if item.get('status') == 200)
-                        return count
-                
-                # Find compression type
-                if "gzip" in q_lower or "compression" in q_lower:
-                    if isinstance(json_data, list):
-                        for item in json_data:
-                            if isinstance(item, dict) and item.get('compression') == 'gzip':
-                                # Return request ID
-                                return item.get('id') or item.get('request_id') or item.get('req_id')
-                    elif isinstance(json_data, dict) and 'requests' in json_data:
-                        for item in json_data['requests']:
-                            if item.get('compression') == 'gzip':
-                                return item.get('id') or item.get('request_id') or item.get('req_id')
-        except Exception as e:
-            print(f"JSON analysis error: {e}")
-    
-    # 15. SQL query results - FIXED with better parsing
-    if "sql" in q_lower or "database" in q_lower or "sqlite" in q_lower:
-        if "age > 18" in full_text or "age greater than 18" in q_lower or "age>18" in full_text:
-            # Look for SQL content
-            sql_match = re.search(r'SQL DATA:\n(.+?)(?:\n\n|$)', context, re.DOTALL)
-            if sql_match:
-                sql_content = sql_match.group(1)
-                # More flexible pattern: VALUES (id, 'name', age) or VALUES(id,'name',age)
-                # Extract all numbers that come after quoted strings (names)
-                inserts = re.findall(r"VALUES?\s*\([^)]*?'[^']*?'\s*,\s*(\d+)", sql_content, re.IGNORECASE)
-                if inserts:
-                    count = sum(1 for age in inserts if int(age) > 18)
-                    return count
-                # Alternative pattern
-                inserts = re.findall(r"VALUES?\s*\(\s*\d+\s*,\s*'[^']+'\s*,\s*(\d+)", sql_content, re.IGNORECASE)
-                if inserts:
-                    count = sum(1 for age in inserts if int(age) > 18)
-                    return count
-    if "number" in q_lower or "value" in q_lower:
-        numbers = re.findall(r'\b\d+(?:\.\d+)?\b', question + context)
-        if numbers:
-            if "first" in q_lower:
-                return float(numbers[0]) if '.' in numbers[0] else int(numbers[0])
-            if "last" in q_lower:
-                return float(numbers[-1]) if '.' in numbers[-1] else int(numbers[-1])
-    
-    # 12. Boolean questions
-    if "is" in q_lower or "does" in q_lower or "can" in q_lower:
-        if "yes" in context.lower() or "true" in context.lower():
-            return True
-        if "no" in context.lower() or "false" in context.lower():
-            return False
+    Callers reserve a slot under the lock and then sleep outside it, so a thread
+    waiting for quota never holds up threads doing other work.
+    """
     
-    # 13. List/array operations
-    if "list" in q_lower or "array" in q_lower:
-        # Extract JSON arrays
-        try:
-            json_match = re.search(r'\[.*\]', context, re.DOTALL)
-            if json_match:
-                arr = json.loads(json_match.group(0))
-                if "length" in q_lower or "count" in q_lower:
-                    return len(arr)
-                if "first" in q_lower:
-                    return arr[0]
-                if "last" in q_lower:
-                    return arr[-1]
-        except:
-            pass
+    def __init__(self, calls_per_minute=GEMINI_CALLS_PER_MINUTE, burst=GEMINI_BURST, backend=None):
+        self.interval = 60.0 / calls_per_minute
+        self.burst = burst
+        self.backend = backend or RATE_STATE
     
-    # 14. Text extraction
-    if "text" in q_lower or "string" in q_lower or "extract" in q_lower:
-        # Look for quoted strings
-        match = re.search(r'"([^"]+)"', context)
-        if match:
-            return match.group(1)
+    def reserve(self, deadline=None):
+        """Reserve the next slot; returns seconds to wait, or None if it cannot start before deadline"""
+        # Wall-clock time: monotonic clocks are not comparable across processes
+        with self.backend.transaction() as state:
+            now = time.time()
+            tat = max(state['tat'], now)  # Theoretical arrival time of the next call
+            start_at = max(tat - (self.burst - 1) * self.interval, state['blocked_until'], now)
+            wait_time = start_at - now
+            if deadline is not None and start_at > deadline:
+                return None
+            state['tat'] = max(tat, start_at) + self.interval
+            return wait_time
     
-    # 15. URL extraction
-    if "url" in q_lower:
-        match = re.search(r'https?://[^\s<>"\']+', question + context)
-        if match:
-            return match.group(0)
+    def acquire(self, deadline=None, cancel=None):
+        """Block until a slot is available; False if that would pass the deadline or cancel is set first"""
+        stop = cancel or threading.Event()
+        if stop.is_set():
+            return False
+        wait_time = self.reserve(deadline)
+        if wait_time is None:
+            return False
+        if wait_time > 0:
+            print(f"⏳ Rate limit: waiting {wait_time:.1f}s...")
+            if stop.wait(wait_time):
+                self.release()  # Cancelled while waiting - the slot goes back unused
+                return False
+        return True
     
-    # 16. Email extraction
-    if "email" in q_lower:
-        match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', question + context)
-        if match:
-            return match.group(0)
+    def release(self):
+        """Hand back a reserved slot that was never used"""
+        with self.backend.transaction() as state:
+            state['tat'] -= self.interval
     
-    # 17. Date extraction
-    if "date" in q_lower:
-        patterns = [
-            r'\d{4}-\d{2}-\d{2}',
-            r'\d{2}/\d{2}/\d{4}',
-            r'\d{2}-\d{2}-\d{4}',
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, context)
-            if match:
-                return match.group(0)
+    def penalize(self, seconds):
+        """Hold every caller back after the server says we are over quota"""
+        with self.backend.transaction() as state:
+            state['blocked_until'] = max(state['blocked_until'], time.time() + seconds)
     
-    return None
+    def snapshot(self):
+        with self.backend.transaction() as state:
+            now = time.time()
+            return {
+                'backend': self.backend.kind,
+                'calls_per_minute': round(60.0 / self.interval, 2),
+                'burst': self.burst,
+                'recent_calls': len(recent_calls(state, now)),
+                'next_slot_in': round(max(0.0, state['tat'] - (self.burst - 1) * self.interval - now), 2),
+                'blocked_for': round(max(0.0, state['blocked_until'] - now), 2)
+            }
+
+GEMINI_LIMITER = TokenBucketLimiter()
+
+def bump_stat(name, amount=1):
+    with RATE_STATE.transaction() as state:
+        state[name] += amount
+        return state[name]
+
+def track_api_call(deadline=None, cancel=None):
+    """Track API usage for rate limiting; False if no slot is free before deadline or cancel is set"""
+    if not GEMINI_LIMITER.acquire(deadline, cancel):
+        return False
+    record_api_call()
+    return True
+
+async def track_api_call_async(deadline=None):
+    """track_api_call for coroutines: the rate-limit wait holds no thread, the file lock not the loop"""
+    loop = asyncio.get_running_loop()
+    wait_time = await loop.run_in_executor(None, GEMINI_LIMITER.reserve, deadline)
+    if wait_time is None:
+        return False
+    if wait_time > 0:
+        print(f"⏳ Rate limit: waiting {wait_time:.1f}s...")
+        await asyncio.sleep(wait_time)
+    await loop.run_in_executor(None, record_api_call)
+    return True
+
+def record_api_call():
+    with RATE_STATE.transaction() as state:
+        now = time.time()
+        state['ring'][state['ring_pos']] = now
+        state['ring_pos'] = (state['ring_pos'] + 1) % CALL_RING_SIZE
+        state['total_calls'] += 1
+        total, recent = state['total_calls'], len(recent_calls(state, now))
+    print(f"🔥 API Call #{total} (recent: {recent})")
+
+def is_rate_limit_error(error):
+    error_str = str(error).lower()
+    return "429" in error_str or "quota" in error_str or "resource" in error_str
+
+def retry_delay(error, attempt):
+    """Server-suggested Retry-After if present, else exponential backoff; both jittered"""
+    delay = getattr(error, 'retry_after', None)
+    if delay is None:
+        match = RETRY_AFTER_PATTERN.search(str(error))
+        delay = float(match.group(1)) if match else GEMINI_BACKOFF_BASE * (2 ** attempt)
+    return float(delay) * random.uniform(1.0, 1.2)
+
+_GEMINI_MODELS = {}
+_GEMINI_MODELS_LOCK = threading.Lock()
 
-def track_api_call():
-    """Track API usage for rate limiting"""
-    current_time = time.time()
+def get_gemini_model(name=GEMINI_MODEL):
+    """Model clients are reusable and thread-safe - build each one once"""
+    with _GEMINI_MODELS_LOCK:
+        model = _GEMINI_MODELS.get(name)
+        if model is None:
+            model = _GEMINI_MODELS[name] = genai.GenerativeModel(name)
+        return model
+
+# Answers already paid for, in memory and (with DISK_CACHE_DIR) across restarts
+LLM_CACHE = LRUCache(max_bytes=LLM_CACHE_MAX_BYTES, default_ttl=LLM_CACHE_TTL)
+
+def llm_cache_key(model_name, question, context):
+    """Hash of model, normalised question and the packed context actually sent"""
+    normalized = ' '.join(question.lower().split())
+    return hashlib.sha256(f"{model_name}\0{normalized}\0{context}".encode('utf-8')).hexdigest()
+
+def get_cached_answer(key):
+    answer = LLM_CACHE.get(key)
+    if answer is None and DISK_CACHE:
+        entry = DISK_CACHE.get_parsed(key, 'llm')
+        if entry and time.time() - entry['stored_at'] < LLM_CACHE_TTL:
+            answer = entry['answer']
+            LLM_CACHE.set(key, answer)
+    return answer
+
+def store_cached_answer(key, answer):
+    LLM_CACHE.set(key, answer)
+    if DISK_CACHE:
+        DISK_CACHE.put_parsed(key, 'llm', {'answer': answer, 'stored_at': time.time()})
+
+Chunk = namedtuple('Chunk', ['label', 'text'])
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+def split_windows(text, size=CHUNK_CHARS):
+    """Split text into roughly size-char pieces on line boundaries"""
+    pieces, current, length = [], [], 0
+    for line in text.split('\n'):
+        if length + len(line) > size and current:
+            pieces.append('\n'.join(current))
+            current, length = [], 0
+        current.append(line[:size])
+        length += len(line) + 1
+    if current:
+        pieces.append('\n'.join(current))
+    return [p for p in pieces if p.strip()]
+
+def artifact_chunks(artifact):
+    """Labelled, independently rankable pieces of one artifact"""
+    kind, name, data = artifact
+    if kind == 'pdf':
+        for page, text in data.items():
+            for i, piece in enumerate(split_windows(text or "")):
+                yield Chunk(f"PDF {name} PAGE {page}" + (f" (part {i + 1})" if i else ""), piece)
+    elif kind == 'csv':
+        yield Chunk(f"CSV {name} SUMMARY", data.summary())
+        yield Chunk(f"CSV {name} FIRST ROWS", data.head.to_string(index=False))
+        if data.rows > len(data.head):
+            yield Chunk(f"CSV {name} LAST ROWS", data.tail.to_string(index=False))
+    elif kind == 'json':
+        yield Chunk(f"JSON {name} INDEX", data.summary())
+        if data.data is None:
+            data = [data.record('[]', i) for i in range(min(100, len(data.offsets)))]
+        else:
+            data = data.data
+        if isinstance(data, dict):
+            items = [(f".{key}", value) for key, value in data.items()]
+        elif isinstance(data, list):
+            items = [(f"[{i}:{i + 20}]", data[i:i + 20]) for i in range(0, len(data), 20)]
+        else:
+            items = [("", data)]
+        for path, value in items:
+            for i, piece in enumerate(split_windows(json.dumps(value, indent=1, default=str))):
+                yield Chunk(f"JSON {name}{path}" + (f" (part {i + 1})" if i else ""), piece)
+    elif kind == 'sql':
+        yield Chunk(f"SQL {name} SCHEMA",
+                    '\n'.join(f"{t} ({data.row_counts[t]} rows): {', '.join(c)}" for t, c in data.tables.items()))
+        for i, piece in enumerate(split_windows(data.preview)):
+            yield Chunk(f"SQL {name} (part {i + 1})", piece)
+    elif kind == 'text':
+        if data.bytes > len(data.preview):
+            yield Chunk(f"TEXT {name} SUMMARY", data.summary())
+        for i, piece in enumerate(split_windows(data.preview)):
+            yield Chunk(f"TEXT {name} (part {i + 1})", piece)
+    else:
+        yield Chunk(f"{kind.upper()} {name}", render_artifact(artifact).strip())
+
+ARTIFACT_SECTION = re.compile(
+    r'\n(?=PDF PAGE \d+:|FULL CSV DATA:|CSV SUMMARY:|JSON DATA:|JSON SUMMARY:|SQL DATA:|TEXT FILE:|TEXT SUMMARY:|Image color:)'
+)
+
+def context_chunks(context):
+    """(quiz text, artifact chunks) from a QuizContext, or from section headers of an already rendered string"""
+    if isinstance(context, QuizContext) and context.artifacts:
+        chunks = []
+        for artifact in context.artifacts:
+            chunks.extend(artifact_chunks(artifact))
+        return f"QUIZ TEXT:\n{context.quiz_text}", chunks
     
-    # Remove calls older than 1 minute
-    API_STATS['call_times'] = [t for t in API_STATS['call_times'] if current_time - t < 60]
+    text = context.text if isinstance(context, QuizContext) else context
+    quiz_text, *sections = ARTIFACT_SECTION.split('\n' + text.strip())  # Everything before the first artifact
+    chunks = []
+    for section in sections:
+        header, _, body = section.strip().partition('\n')
+        for piece in split_windows(body or header):
+            chunks.append(Chunk(header[:60], piece))
+    return quiz_text.strip(), chunks
+
+def tokenize(text):
+    return [t for t in re.findall(r'[a-z0-9_]+', text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+def rank_chunks(question, chunks, k1=1.2, b=0.75):
+    """BM25 score of each chunk (label included) against the question"""
+    terms = set(tokenize(question))
+    docs = [Counter(tokenize(c.label + ' ' + c.text)) for c in chunks]
+    if not docs or not terms:
+        return [0.0] * len(chunks)
+    lengths = [sum(d.values()) for d in docs]
+    avg_len = (sum(lengths) / len(lengths)) or 1
+    n = len(docs)
+    idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5))
+           for t in terms for df in [sum(1 for d in docs if t in d)]}
+    scores = []
+    for doc, length in zip(docs, lengths):
+        score = 0.0
+        for t in terms:
+            tf = doc.get(t, 0)
+            if tf:
+                score += idf[t] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_len))
+        scores.append(score)
+    return scores
+
+def pack_context(question, context, budget_tokens=GEMINI_CONTEXT_TOKENS):
+    """The quiz text in full, then the best-matching artifact chunks that fit the token budget, in original order"""
+    text = context.text if isinstance(context, QuizContext) else context
+    if estimate_tokens(text) <= budget_tokens:
+        return text
     
-    # If too many recent calls, wait
-    if len(API_STATS['call_times']) >= 15:  # Max 15 calls per minute
-        wait_time = 60 - (current_time - API_STATS['call_times'][0])
-        if wait_time > 0:
-            print(f"⏳ Rate limit: waiting {wait_time:.0f}s...")
-            time.sleep(wait_time)
-            API_STATS['call_times'] = []
+    # The question itself is never cut or ranked away; the budget only applies to artifacts
+    quiz_text, chunks = context_chunks(context)
+    parts = [quiz_text] if quiz_text else []
+    scores = rank_chunks(question, chunks)
+    chosen = []
+    for i in sorted(range(len(chunks)), key=lambda i: (-scores[i], i)):
+        cost = estimate_tokens(chunks[i].label) + estimate_tokens(chunks[i].text)
+        if cost <= budget_tokens:
+            chosen.append(i)
+            budget_tokens -= cost
     
-    API_STATS['call_times'].append(current_time)
-    API_STATS['total_calls'] += 1
-    print(f"🔥 API Call #{API_STATS['total_calls']} (recent: {len(API_STATS['call_times'])})")
+    parts.extend(f"[{chunks[i].label}]\n{chunks[i].text}" for i in sorted(chosen))
+    return '\n\n'.join(parts)
+
+def first_answer_line(text, complete=False):
+    """Cleaned first line of a (possibly partial) reply, or None while it may still change"""
+    # Clean up answer
+    answer = re.sub(r'```.*?```', '', text.lstrip(), flags=re.DOTALL)
+    if not complete and '```' in answer:
+        return None  # Inside an unfinished code block
+    answer = answer.replace('Answer:', '').replace('answer:', '').lstrip()
+    if complete:
+        return answer.strip().split('\n')[0]  # Take first line only
+    if '\n' not in answer:
+        return None
+    return answer.split('\n')[0].strip()
 
-def solve_with_gemini_safe(question, context):
-    """Use Gemini with strict rate limiting"""
-    track_api_call()
+def generate_answer(model, prompt, stop):
+    """Run one Gemini request; when streaming, stop reading once the first answer line is complete"""
+    if not GEMINI_STREAM:
+        return first_answer_line(model.generate_content(prompt).text, complete=True)
     
-    try:
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')  # Use experimental for better quota
-        
-        # Truncate context to save tokens
-        if len(context) > 5000:
-            context = context[:2500] + "\n...\n" + context[-2500:]
-        
-        prompt = f"""Answer concisely. Return ONLY the final answer.
+    text = ""
+    for chunk in model.generate_content(prompt, stream=True):
+        if stop.is_set():
+            return None
+        text += chunk.text
+        answer = first_answer_line(text)
+        if answer is not None:
+            return answer
+    return first_answer_line(text, complete=True)
+
+def gemini_request(question, context):
+    """Cache key and prompt for a question"""
+    # Keep only the chunks most relevant to the question to save tokens
+    context = pack_context(question, context)
+    cache_key = llm_cache_key(GEMINI_MODEL, question, context)
+    prompt = f"""Answer concisely. Return ONLY the final answer.
 
 Q: {question}
 
 Data: {context}
 
 Answer:"""
+    return cache_key, prompt
+
+def solve_with_gemini_safe(question, context, deadline=None, cancel=None):
+    """Use Gemini with strict rate limiting; setting cancel abandons the request"""
+    cache_key, prompt = gemini_request(question, context)
+    
+    # Cache hits skip both the rate limiter and the network
+    cached = get_cached_answer(cache_key)
+    if cached is not None:
+        print("↻ Using cached Gemini answer")
+        return cached
+    
+    model = get_gemini_model()
+    stop = cancel or threading.Event()
+    steps = gemini_call_steps(deadline, stop)
+    reply = None
+    while True:
+        try:
+            op, arg = steps.send(reply)
+        except StopIteration as done:
+            answer = done.value
+            break
+        if op == 'slot':
+            reply = track_api_call(deadline, stop)
+        elif op == 'penalize':
+            reply = GEMINI_LIMITER.penalize(arg)
+        else:
+            future = GEMINI_EXECUTOR.submit(generate_answer, model, prompt, stop)
+            try:
+                reply = future.result(timeout=arg), None
+            except Exception as e:
+                reply = None, e
+    
+    if answer:
+        store_cached_answer(cache_key, answer)
+    return answer
+
+def gemini_call_steps(deadline, stop):
+    """Gemini retry loop with the blocking work left to the caller, so threads and coroutines share it
+    
+    Yields ('slot', None) for a rate-limit slot (send back True/False), ('call', timeout) to run
+    the request (send back (answer, error)) and ('penalize', seconds) after a 429; returns the answer.
+    """
+    for attempt in range(GEMINI_MAX_ATTEMPTS):
+        if not (yield 'slot', None):
+            if not stop.is_set():  # A cancelled hedge is no longer needed - nothing to report
+                print("⏱️ No Gemini slot before deadline - skipping")
+            return None
         
-        response = model.generate_content(prompt)
-        answer = response.text.strip()
-        
-        # Clean up answer
-        answer = re.sub(r'```.*?```', '', answer, flags=re.DOTALL)
-        answer = answer.replace('Answer:', '').replace('answer:', '').strip()
-        answer = answer.split('\n')[0]  # Take first line only
-        
-        return answer
+        timeout = GEMINI_CALL_TIMEOUT
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.time())
+        timeout = max(0.0, timeout)
         
-    except Exception as e:
-        error_str = str(e)
-        if "429" in error_str or "quota" in error_str.lower() or "resource" in error_str.lower():
-            print(f"⚠️ API LIMIT HIT - Waiting 90s...")
-            time.sleep(90)
-            # Try one more time
-            try:
-                response = model.generate_content(prompt)
-                return response.text.strip()
-            except:
-                print("❌ Still rate limited - skipping Gemini")
-                return None
-        print(f"Gemini error: {e}")
-        return None
+        answer, error = yield 'call', timeout
+        if error is None:
+            return answer
+        if isinstance(error, (FuturesTimeout, asyncio.TimeoutError)):
+            stop.set()  # Streaming worker stops at its next chunk
+            print(f"⏱️ Gemini gave no answer within {timeout:.0f}s")
+            return None
+        if not is_rate_limit_error(error):
+            print(f"Gemini error: {error}")
+            return None
+        # The limiter makes every caller (including this one) wait out the penalty
+        delay = retry_delay(error, attempt)
+        yield 'penalize', delay
+        print(f"⚠️ API LIMIT HIT - backing off {delay:.0f}s")
+    
+    print("❌ Still rate limited - skipping Gemini")
+    return None
+
+ANSWER_PATTERNS = [
+    re.compile(r'answer[:\s]+([^\n]+)', re.IGNORECASE),
+    re.compile(r'result[:\s]+([^\n]+)', re.IGNORECASE),
+    re.compile(r'solution[:\s]+([^\n]+)', re.IGNORECASE),
+]
+
+def solve_with_patterns(context):
+    """Look for explicit answers in context"""
+    for pattern in ANSWER_PATTERNS:
+        match = pattern.search(context.text)
+        if match:
+            candidate = match.group(1).strip()
+            if len(candidate) < 200:  # Reasonable answer length
+                return candidate
+    return None
 
-def solve_question(question, context):
+def solve_question(question, context, deadline=None):
     """Main solving function - logic first, Gemini as last resort"""
+    if isinstance(context, str):
+        context = QuizContext.from_text(context)
+    if HEDGED_SOLVE:
+        return solve_question_hedged(question, context, deadline)
+    
+    answer = solve_locally(question, context, deadline)
+    if answer is not None:
+        return answer
+    
+    # PRIORITY 3: Gemini (only if really needed)
+    print("→ Using Gemini (last resort)...")
+    bump_stat('gemini_solves')
+    answer = solve_with_gemini_safe(question, context, deadline)
     
+    return answer if answer else "0"
+
+def solve_locally(question, context, deadline=None):
+    """The tiers that need no API: logic rules, then patterns in the context"""
     # PRIORITY 1: Advanced logic (fast, no API)
-    answer = solve_with_advanced_logic(question, context)
+    answer = solve_with_advanced_logic(question, context, deadline)
     if answer is not None:
-        API_STATS['logic_solves'] += 1
-        print(f"✓ Solved with LOGIC! (Total logic: {API_STATS['logic_solves']})")
+        total = bump_stat('logic_solves')
+        print(f"✓ Solved with LOGIC! (Total logic: {total})")
         return answer
     
     # PRIORITY 2: Pattern matching on context
     print("→ Trying pattern matching...")
+    answer = solve_with_patterns(context)
+    if answer is not None:
+        total = bump_stat('pattern_solves')
+        print(f"✓ Found in context! (Total pattern: {total})")
+    return answer
+
+def solve_question_hedged(question, context, deadline=None):
+    """Race the tiers: a confident logic rule wins outright, otherwise Gemini runs alongside"""
+    answer, rule = solve_with_rules(question, context, deadline)
+    if answer is not None and not rule.generic:
+        total = bump_stat('logic_solves')
+        print(f"✓ Solved with LOGIC ({rule.name})! (Total logic: {total})")
+        return answer
     
-    # Look for explicit answers in context
-    answer_patterns = [
-        r'answer[:\s]+([^\n]+)',
-        r'result[:\s]+([^\n]+)',
-        r'solution[:\s]+([^\n]+)',
-    ]
+    # Low confidence: start Gemini now instead of after the other tiers
+    print("→ Low-confidence logic - hedging with Gemini in background...")
+    cancel = threading.Event()
+    future = HEDGE_EXECUTOR.submit(solve_with_gemini_safe, question, context, deadline, cancel)
     
-    for pattern in answer_patterns:
-        match = re.search(pattern, context, re.IGNORECASE)
-        if match:
-            candidate = match.group(1).strip()
-            if len(candidate) < 200:  # Reasonable answer length
-                API_STATS['pattern_solves'] += 1
-                print(f"✓ Found in context! (Total pattern: {API_STATS['pattern_solves']})")
-                return candidate
+    candidates = []  # (confidence, source, answer)
+    if answer is not None:
+        candidates.append((ANSWER_CONFIDENCE['generic_logic'], 'logic', answer))
+    pattern_answer = solve_with_patterns(context)
+    if pattern_answer is not None:
+        candidates.append((ANSWER_CONFIDENCE['pattern'], 'pattern', pattern_answer))
     
-    # PRIORITY 3: Gemini (only if really needed)
-    print("→ Using Gemini (last resort)...")
-    API_STATS['gemini_solves'] += 1
-    time.sleep(3)  # Extra safety delay
-    answer = solve_with_gemini_safe(question, context)
+    # With a fallback in hand, only wait HEDGE_WAIT for Gemini; never past the deadline
+    wait_for = HEDGE_WAIT if candidates else None
+    if deadline is not None:
+        remaining = max(0.0, deadline - time.time())
+        wait_for = remaining if wait_for is None else min(wait_for, remaining)
+    try:
+        gemini_answer = future.result(timeout=wait_for)
+    except FuturesTimeout:
+        gemini_answer = None
+        cancel.set()
+        future.cancel()
+        print("⏱️ Gemini not back in time - using best fallback")
     
-    return answer if answer else "0"
+    if gemini_answer:
+        candidates.append((ANSWER_CONFIDENCE['gemini'], 'gemini', gemini_answer))
+    if not candidates:
+        bump_stat('gemini_solves')  # As in solve_question: Gemini was the last resort, even if it failed
+        return "0"
+    
+    confidence, source, answer = max(candidates, key=lambda c: c[0])
+    total = bump_stat(f"{source}_solves")
+    print(f"✓ Picked {source.upper()} answer (confidence {confidence}, total {source}: {total})")
+    return answer
 
 def parse_answer(answer_str):
     """Parse answer to correct type"""
@@ -655,16 +3275,256 @@ def parse_answer(answer_str):
     
     return answer_str
 
-def process_quiz_task(url):
-    """Process a single quiz task"""
+Artifact = namedtuple('Artifact', ['kind', 'name', 'data'])
+
+def render_artifact(artifact):
+    """Text form of one artifact, as sent to Gemini and scanned by the regex rules"""
+    kind, data = artifact.kind, artifact.data
+    if kind == 'pdf':
+        return ''.join(f"\nPDF PAGE {page}:\n{text[:1000]}\n" for page, text in data.items())
+    if kind == 'csv':
+        if data.frame is not None and data.rows <= CSV_CONTEXT_ROWS:
+            return f"\nFULL CSV DATA:\n{data.frame.to_string(index=False)}\n"
+        return f"\nCSV SUMMARY:\n{data.describe()}\n"
+    if kind == 'json':
+        if data.chars <= JSON_CONTEXT_CHARS:
+            return f"\nJSON DATA:\n{data.preview}\n"
+        return f"\nJSON SUMMARY:\n{data.describe()}\n"
+    if kind == 'image':
+        palette = ', '.join(f"{c} ({n})" for c, n in data['palette'])
+        return (f"\nImage color: {data['dominant']}\n"
+                f"Image mean color: {data['mean']}\n"
+                f"Image palette: {palette}\n"
+                f"Image size: {data['width']}x{data['height']}, pixels: {data['pixels']}, unique colors: {data['unique_colors']}\n")
+    if kind == 'sql':
+        return f"\nSQL DATA:\n{data.describe()}\n"
+    if kind == 'text':
+        if data.bytes <= TEXT_CONTEXT_CHARS:
+            return f"\nTEXT FILE:\n{data.preview}\n"
+        return f"\nTEXT SUMMARY:\n{data.describe()}\n"
+    return ""
+
+class QuizContext:
+    """Parsed quiz artifacts kept as objects; the text form is rendered once, on demand"""
+    
+    def __init__(self, quiz_text=""):
+        self.quiz_text = quiz_text
+        self.artifacts = []
+        self._text = None
+    
+    @classmethod
+    def from_text(cls, text):
+        """Wrap an already rendered context string"""
+        ctx = cls()
+        ctx._text = text
+        return ctx
+    
+    def add(self, artifact):
+        self.artifacts.append(artifact)
+        self._text = None
+    
+    def of_kind(self, kind):
+        return [a.data for a in self.artifacts if a.kind == kind]
+    
+    def first(self, kind, default=None):
+        for a in self.artifacts:
+            if a.kind == kind:
+                return a.data
+        return default
+    
+    def has(self, kind):
+        return any(a.kind == kind for a in self.artifacts)
+    
+    @property
+    def text(self):
+        if self._text is None:
+            parts = [f"QUIZ TEXT:\n{self.quiz_text}\n\n"]
+            parts.extend(render_artifact(a) for a in self.artifacts)
+            self._text = ''.join(parts)
+        return self._text
+    
+    def __str__(self):
+        return self.text
+
+def process_file(file_url, question="", deadline=None):
+    """Download and parse one file, returning its artifact (or None)"""
+    name = file_url.split('/')[-1]
+    if deadline is not None and deadline - time.time() < MIN_STAGE_SECONDS:
+        print(f"⏭️ Skipping {name}: out of time")
+        return None
+    print(f"Processing: {name}")
+    try:
+        return parse_file(file_url, download_file(file_url, deadline), question)
+    except Exception as e:
+        print(f"File error ({name}): {e}")
+    
+    return None
+
+def parse_file(file_url, content, question=""):
+    """Parse downloaded bytes into an artifact, chosen by file extension"""
+    name = file_url.split('/')[-1]
+    with FILE_BYTES_BUDGET.reserve(len(content)):
+        if file_url.endswith('.pdf'):
+            # Only extract the pages the question explicitly asks about, if it names any
+            texts = extract_pdf_text(content, pages_mentioned(question) or None) or extract_pdf_text(content)
+            return Artifact('pdf', name, texts)
+        
+        elif file_url.endswith('.csv'):
+            table = parse_csv_data(content)
+            if table is not None:
+                print(f"  → CSV: {table.rows} rows, columns: {table.columns} ({table.encoding})")
+                return Artifact('csv', name, table)
+        
+        elif file_url.endswith('.json'):
+            return Artifact('json', name, parse_json_data(content))
+        
+        elif file_url.endswith(('.png', '.jpg')):
+            stats = image_stats(content)
+            if stats:
+                return Artifact('image', name, stats)
+        
+        elif file_url.endswith('.sql'):
+            return Artifact('sql', name, load_sql_database(content))
+        
+        elif file_url.endswith('.txt'):
+            return Artifact('text', name, TextFile(content))
+    
+    return None
+
+def process_files(file_urls, question="", timeout=FILE_TIMEOUT, deadline=None):
+    """Process files on the shared worker pool; one slow or broken file never blocks the rest"""
+    file_urls = [u for u in file_urls if any(ext in u.lower() for ext in FILE_EXTENSIONS)]
+    started = {}
+    
+    def run(i, file_url):
+        started[i] = time.time()
+        file_deadline = started[i] + timeout
+        if deadline is not None:
+            file_deadline = min(file_deadline, deadline)
+        return process_file(file_url, question, file_deadline)
+    
+    futures = {FILE_EXECUTOR.submit(run, i, u): i for i, u in enumerate(file_urls)}
+    artifacts = [None] * len(file_urls)
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                artifacts[futures[future]] = future.result()
+            except Exception as e:
+                print(f"File error: {e}")
+        
+        now = time.time()
+        if deadline is not None and now >= deadline:
+            print(f"⏱️ File stage out of time, dropping {len(pending)} file(s)")
+            for future in pending:
+                future.cancel()
+            break
+        for future in list(pending):
+            i = futures[future]
+            if i in started and now - started[i] > timeout:
+                print(f"⏱️ File timed out after {timeout:.0f}s: {file_urls[i].split('/')[-1]}")
+                future.cancel()
+                pending.discard(future)
+    
+    return [a for a in artifacts if a is not None]
+
+class StepBudget:
+    """Wall-clock budget for one quiz step; each stage gets a deadline out of what is left"""
+    
+    def __init__(self, limit=QUIZ_TIME_LIMIT, reserve=SUBMIT_RESERVE):
+        self.started = time.time()
+        self.deadline = self.started + limit
+        self.answer_by = self.deadline - reserve
+        self.timings = {}
+    
+    def remaining(self):
+        return max(0.0, self.answer_by - time.time())
+    
+    @contextmanager
+    def stage(self, name):
+        """Time a stage and yield its deadline; an overrun only squeezes the stages after it"""
+        start = time.time()
+        try:
+            yield start + self.remaining() * STAGE_SHARES.get(name, 1.0)
+        finally:
+            self.timings[name] = round(time.time() - start, 3)
+
+class StepPacer:
+    """Gap between quiz steps: short while submissions succeed, backing off on errors and 429s
+    
+    One per sequence, so one job's errors never slow down the others.
+    """
+    
+    def __init__(self, min_gap=MIN_STEP_GAP, max_gap=MAX_STEP_GAP):
+        self.min_gap = min_gap
+        self.max_gap = max_gap
+        self.gap = min_gap
+        self.retry_at = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, status, retry_after=None):
+        """Record a submission's HTTP status (None for a network error)"""
+        with self._lock:
+            if status is not None and status < 400:
+                self.gap = max(self.min_gap, self.gap / 2)
+            else:
+                self.gap = min(self.max_gap, max(self.gap, 1.0) * 2)
+            if retry_after:
+                try:
+                    self.retry_at = time.time() + min(float(retry_after), self.max_gap)
+                except ValueError:
+                    pass
+    
+    def delay(self, deadline=None):
+        """Seconds to hold off before the next step"""
+        with self._lock:
+            until = max(time.time() + self.gap, self.retry_at)
+        if deadline is not None:
+            until = min(until, deadline)
+        delay = max(0.0, until - time.time())
+        if delay > 0:
+            print(f"⏸️ Pacing {delay:.1f}s before next step")
+        return delay
+    
+    def wait(self, deadline=None):
+        time.sleep(self.delay(deadline))
+
+
+def process_quiz_task(url, budget=None):
+    """Process a single quiz task within its time budget; always comes back with some answer"""
+    budget = budget or StepBudget()
     print(f"\n{'='*80}")
-    print(f"Processing: {url}")
+    print(f"Processing: {url} ({budget.remaining():.0f}s to answer)")
     print(f"{'='*80}")
     
-    quiz_text, html_content = fetch_quiz_page(url)
+    with budget.stage('fetch') as deadline:
+        quiz_text, html_content = fetch_quiz_page(url, deadline)
     print(f"\n{quiz_text[:500]}...\n")
     
-    # Extract files
+    file_urls = find_file_urls(quiz_text, html_content)
+    context = QuizContext(quiz_text)
+    
+    # Process files concurrently; artifacts keep file_urls order
+    with budget.stage('files') as deadline:
+        if file_urls and deadline - time.time() >= MIN_STAGE_SECONDS:
+            for artifact in process_files(file_urls, quiz_text, deadline=deadline):
+                context.add(artifact)
+        elif file_urls:
+            print("⏭️ No time left for files - solving from page text")
+    
+    # Solve; whatever happens, a best-effort answer still goes out
+    with budget.stage('solve') as deadline:
+        try:
+            answer = solve_question(quiz_text, context, deadline)
+        except Exception as e:
+            print(f"Solve error: {e}")
+            answer = "0"
+    
+    return prepare_submission(answer, quiz_text, html_content)
+
+def find_file_urls(quiz_text, html_content):
+    """Data file links mentioned in the quiz page"""
     base_url = "https://tds-llm-analysis.s-anand.net"
     file_urls = []
     
@@ -674,138 +3534,457 @@ def process_quiz_task(url):
         file_urls.append(base_url + clean_path)
     
     file_urls += re.findall(r'https://tds-llm-analysis\.s-anand\.net[^\s<>"\']+', html_content)
-    file_urls = list(set(file_urls))
+    file_urls = sorted(set(file_urls))
     
     print(f"Files found: {len(file_urls)}")
-    
-    context = f"QUIZ TEXT:\n{quiz_text}\n\n"
-    
-    # Process files
-    for file_url in file_urls:
-        if any(ext in file_url.lower() for ext in ['.pdf', '.csv', '.json', '.png', '.jpg', '.txt', '.sql']):
-            print(f"Processing: {file_url.split('/')[-1]}")
-            try:
-                content = download_file(file_url)
-                
-                if file_url.endswith('.pdf'):
-                    texts = extract_pdf_text(content)
-                    for page, text in texts.items():
-                        context += f"\nPDF PAGE {page}:\n{text[:1000]}\n"
-                
-                elif file_url.endswith('.csv'):
-                    df = parse_csv_data(content)
-                    if df is not None:
-                        context += f"\nFULL CSV DATA:\n{df.to_string(index=False)}\n"
-                        print(f"  → CSV: {len(df)} rows, columns: {list(df.columns)}")
-                
-                elif file_url.endswith('.json'):
-                    data = json.loads(content.decode('utf-8'))
-                    context += f"\nJSON DATA:\n{json.dumps(data, indent=2)}\n"
-                
-                elif file_url.endswith(('.png', '.jpg')):
-                    color = analyze_image_color(content)
-                    if color:
-                        context += f"\nImage color: {color}\n"
-                
-                elif file_url.endswith('.sql'):
-                    sql_text = content.decode('utf-8')
-                    context += f"\nSQL DATA:\n{sql_text}\n"
-                    print(f"  → SQL: {len(sql_text)} chars")
-                
-                elif file_url.endswith('.txt'):
-                    text = content.decode('utf-8')
-                    context += f"\nTEXT FILE:\n{text}\n"
-                    
-            except Exception as e:
-                print(f"File error: {e}")
-    
-    # Solve
-    answer = solve_question(quiz_text, context)
-    
+    return file_urls
+
+def prepare_submission(answer, quiz_text, html_content):
+    """Typed answer and the submit URL named on the page"""
     # Don't convert lists/dicts to strings!
     if not isinstance(answer, (list, dict)):
         answer = parse_answer(str(answer))
     
     print(f"\n✅ Answer: {answer} (type: {type(answer).__name__})")
     
-    submit_url = re.findall(r'https://[^\s<>"]+/submit', quiz_text + html_content)
+    submit_url = SUBMIT_URL_PATTERN.findall(quiz_text + html_content)
     submit_url = submit_url[0] if submit_url else "https://tds-llm-analysis.s-anand.net/submit"
     
     return submit_url, answer
 
-def submit_answer(submit_url, url, answer):
-    """Submit answer"""
+def submit_answer(submit_url, url, answer, deadline=None, pacer=None):
+    """Submit answer; pacer, if given, learns from the response"""
     payload = {"email": EMAIL, "secret": SECRET, "url": url, "answer": answer}
     
     print(f"\n📤 Submitting...")
     
     try:
-        response = requests.post(submit_url, json=payload, timeout=30)
+        response = HTTP_SESSION.post(submit_url, json=payload, timeout=time_left(deadline, 30))
         print(f"Status: {response.status_code}")
+        if pacer:
+            pacer.observe(response.status_code, response.headers.get('Retry-After'))
         result = response.json()
         print(f"Response: {json.dumps(result, indent=2)}")
         return result
     except Exception as e:
         print(f"Submit error: {e}")
+        if pacer:
+            pacer.observe(None)
         return {"correct": False, "reason": str(e)}
 
-def solve_quiz_sequence(initial_url):
-    """Solve quiz sequence"""
+def solve_quiz_sequence(initial_url, job=None):
+    """Solve quiz sequence, reporting each step to job if one is given"""
     current_url = initial_url
     iteration = 0
     start_time = time.time()
+    pacer = StepPacer()
     
-    while current_url and iteration < 30:
+    while current_url and iteration < MAX_QUIZ_STEPS:
         iteration += 1
-        print(f"\n\n{'#'*80}")
-        print(f"# ITERATION {iteration} - Time: {time.time()-start_time:.1f}s")
-        print(f"# API Calls: {API_STATS['total_calls']} | Logic: {API_STATS['logic_solves']} | Pattern: {API_STATS['pattern_solves']} | Gemini: {API_STATS['gemini_solves']}")
-        print(f"{'#'*80}")
+        budget = StepBudget()  # The step's clock starts at the previous submission
+        if iteration > 1:
+            pacer.wait(budget.answer_by)
+        print_step_header(iteration, start_time)
         
         try:
-            submit_url, answer = process_quiz_task(current_url)
-            result = submit_answer(submit_url, current_url, answer)
-            
-            if result.get('correct'):
-                print("\n✅✅✅ CORRECT!")
-            else:
-                print(f"\n❌❌❌ WRONG: {result.get('reason', '')}")
-            
-            next_url = result.get('url', '')
-            if next_url and next_url != current_url:
-                current_url = next_url
-                time.sleep(4)  # Conservative rate limiting
-            else:
-                print("\n🎉 SEQUENCE COMPLETE!")
-                break
+            if job:
+                job.current_url = current_url
+            submit_url, answer = process_quiz_task(current_url, budget)
+            result = submit_answer(submit_url, current_url, answer, budget.deadline, pacer)
+            print(f"⏱️ Step timings: {budget.timings} ({time.time() - budget.started:.1f}s total)")
+            if job:
+                job.add_step(current_url, answer, result, budget)
+            current_url = next_quiz_url(result, current_url)
         except Exception as e:
             print(f"\n💥 ERROR: {e}")
             import traceback
             traceback.print_exc()
+            if job:
+                job.error = str(e)
             break
     
+    print_sequence_summary(iteration, start_time)
+
+def print_step_header(iteration, start_time, stats=None):
+    stats = stats or api_stats()
+    print(f"\n\n{'#'*80}")
+    print(f"# ITERATION {iteration} - Time: {time.time()-start_time:.1f}s")
+    print(f"# API Calls: {stats['total_calls']} | Logic: {stats['logic_solves']} | Pattern: {stats['pattern_solves']} | Gemini: {stats['gemini_solves']}")
+    print(f"{'#'*80}")
+
+def next_quiz_url(result, current_url):
+    """Log a submission result; the next quiz URL, or None when the sequence is over"""
+    if result.get('correct'):
+        print("\n✅✅✅ CORRECT!")
+    else:
+        print(f"\n❌❌❌ WRONG: {result.get('reason', '')}")
+    
+    next_url = result.get('url', '')
+    if next_url and next_url != current_url:
+        return next_url
+    print("\n🎉 SEQUENCE COMPLETE!")
+    return None
+
+def print_sequence_summary(iteration, start_time, stats=None):
+    stats = stats or api_stats()
     print(f"\n{'='*80}")
     print(f"📊 FINAL STATS")
     print(f"{'='*80}")
     print(f"Iterations: {iteration}")
     print(f"Time: {time.time()-start_time:.1f}s")
-    print(f"Total API Calls: {API_STATS['total_calls']}")
-    print(f"Logic Solves: {API_STATS['logic_solves']}")
-    print(f"Pattern Solves: {API_STATS['pattern_solves']}")
-    print(f"Gemini Solves: {API_STATS['gemini_solves']}")
+    print(f"Total API Calls: {stats['total_calls']}")
+    print(f"Logic Solves: {stats['logic_solves']}")
+    print(f"Pattern Solves: {stats['pattern_solves']}")
+    print(f"Gemini Solves: {stats['gemini_solves']}")
+    print(f"{'='*80}")
+
+async def solve_with_gemini_async(question, context, deadline=None):
+    """solve_with_gemini_safe for coroutines; file locks, disk and the request run off the loop thread"""
+    loop = asyncio.get_running_loop()
+    cache_key, prompt = await loop.run_in_executor(None, gemini_request, question, context)
+    
+    cached = await loop.run_in_executor(None, get_cached_answer, cache_key)
+    if cached is not None:
+        print("↻ Using cached Gemini answer")
+        return cached
+    
+    model = get_gemini_model()
+    stop = threading.Event()
+    steps = gemini_call_steps(deadline, stop)
+    reply = None
+    while True:
+        try:
+            op, arg = steps.send(reply)
+        except StopIteration as done:
+            answer = done.value
+            break
+        if op == 'slot':
+            reply = await track_api_call_async(deadline)
+        elif op == 'penalize':
+            reply = await loop.run_in_executor(None, GEMINI_LIMITER.penalize, arg)
+        else:
+            try:
+                reply = await asyncio.wait_for(
+                    loop.run_in_executor(GEMINI_EXECUTOR, generate_answer, model, prompt, stop), arg
+                ), None
+            except Exception as e:
+                reply = None, e
+    
+    if answer:
+        await loop.run_in_executor(None, store_cached_answer, cache_key, answer)
+    return answer
+
+async def solve_question_async(question, context, deadline=None):
+    """solve_question for coroutines: local tiers on the file pool, then async Gemini"""
+    loop = asyncio.get_running_loop()
+    if isinstance(context, str):
+        context = QuizContext.from_text(context)
+    if HEDGED_SOLVE:
+        return await loop.run_in_executor(None, solve_question_hedged, question, context, deadline)
+    
+    answer = await loop.run_in_executor(FILE_EXECUTOR, solve_locally, question, context, deadline)
+    if answer is not None:
+        return answer
+    
+    print("→ Using Gemini (last resort)...")
+    await loop.run_in_executor(None, bump_stat, 'gemini_solves')
+    answer = await solve_with_gemini_async(question, context, deadline)
+    
+    return answer if answer else "0"
+
+async def process_files_async(file_urls, question="", timeout=FILE_TIMEOUT, deadline=None):
+    """Download on I/O threads and parse on the file pool; files that overrun are dropped"""
+    loop = asyncio.get_running_loop()
+    file_urls = [u for u in file_urls if any(ext in u.lower() for ext in FILE_EXTENSIONS)]
+    
+    async def run(file_url):
+        name = file_url.split('/')[-1]
+        file_deadline = time.time() + timeout
+        if deadline is not None:
+            file_deadline = min(file_deadline, deadline)
+        if file_deadline - time.time() < MIN_STAGE_SECONDS:
+            print(f"⏭️ Skipping {name}: out of time")
+            return None
+        print(f"Processing: {name}")
+        try:
+            content = await asyncio.wait_for(
+                loop.run_in_executor(None, download_file, file_url, file_deadline),
+                max(0.0, file_deadline - time.time())
+            )
+            return await asyncio.wait_for(
+                loop.run_in_executor(FILE_EXECUTOR, parse_file, file_url, content, question),
+                max(0.0, file_deadline - time.time())
+            )
+        except asyncio.TimeoutError:
+            print(f"⏱️ File timed out: {name}")
+        except Exception as e:
+            print(f"File error ({name}): {e}")
+        return None
+    
+    artifacts = await asyncio.gather(*(run(u) for u in file_urls))
+    return [a for a in artifacts if a is not None]
+
+async def fetch_quiz_page_async(url, deadline=None):
+    """fetch_quiz_page for coroutines: browser renders wait on their own pool, not the I/O threads"""
+    loop = asyncio.get_running_loop()
+    page = await loop.run_in_executor(None, fetch_page_fast, url, deadline)
+    if page:
+        return page
+    return await loop.run_in_executor(BROWSER_EXECUTOR, render_quiz_page, url, deadline)
+
+async def process_quiz_task_async(url, budget=None):
+    """process_quiz_task as a coroutine"""
+    loop = asyncio.get_running_loop()
+    budget = budget or StepBudget()
+    print(f"\n{'='*80}")
+    print(f"Processing: {url} ({budget.remaining():.0f}s to answer)")
     print(f"{'='*80}")
+    
+    with budget.stage('fetch') as deadline:
+        quiz_text, html_content = await fetch_quiz_page_async(url, deadline)
+    print(f"\n{quiz_text[:500]}...\n")
+    
+    file_urls = find_file_urls(quiz_text, html_content)
+    context = QuizContext(quiz_text)
+    
+    with budget.stage('files') as deadline:
+        if file_urls and deadline - time.time() >= MIN_STAGE_SECONDS:
+            for artifact in await process_files_async(file_urls, quiz_text, deadline=deadline):
+                context.add(artifact)
+        elif file_urls:
+            print("⏭️ No time left for files - solving from page text")
+    
+    with budget.stage('solve') as deadline:
+        try:
+            answer = await solve_question_async(quiz_text, context, deadline)
+        except Exception as e:
+            print(f"Solve error: {e}")
+            answer = "0"
+    
+    return prepare_submission(answer, quiz_text, html_content)
+
+async def solve_quiz_sequence_async(initial_url, job=None):
+    """solve_quiz_sequence as a coroutine; waiting costs no thread, so one loop drives many sequences"""
+    loop = asyncio.get_running_loop()
+    current_url = initial_url
+    iteration = 0
+    start_time = time.time()
+    pacer = StepPacer()
+    
+    while current_url and iteration < MAX_QUIZ_STEPS:
+        iteration += 1
+        budget = StepBudget()  # The step's clock starts at the previous submission
+        if iteration > 1:
+            await asyncio.sleep(pacer.delay(budget.answer_by))
+        print_step_header(iteration, start_time, await loop.run_in_executor(None, api_stats))
+        
+        try:
+            if job:
+                job.current_url = current_url
+            submit_url, answer = await process_quiz_task_async(current_url, budget)
+            result = await loop.run_in_executor(None, submit_answer, submit_url, current_url, answer,
+                                                budget.deadline, pacer)
+            print(f"⏱️ Step timings: {budget.timings} ({time.time() - budget.started:.1f}s total)")
+            if job:
+                job.add_step(current_url, answer, result, budget)
+            current_url = next_quiz_url(result, current_url)
+        except Exception as e:
+            print(f"\n💥 ERROR: {e}")
+            import traceback
+            traceback.print_exc()
+            if job:
+                job.error = str(e)
+            break
+    
+    print_sequence_summary(iteration, start_time, await loop.run_in_executor(None, api_stats))
+
+class AsyncQuizEngine:
+    """Event loop on a background thread; blocking client calls go to its bounded I/O pool
+    
+    Browser renders go to BROWSER_EXECUTOR instead, so waits for a browser never pin the I/O threads.
+    """
+    
+    def __init__(self, io_workers=ASYNC_IO_WORKERS):
+        self.io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='async-io')
+        self._loop = None
+        self._lock = threading.Lock()
+    
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop.set_default_executor(self.io_executor)
+                threading.Thread(target=self._loop.run_forever, name='async-engine', daemon=True).start()
+            return self._loop
+    
+    def submit(self, coro):
+        """Schedule a coroutine from any thread; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop())
+    
+    def run(self, coro):
+        return self.submit(coro).result()
+
+ASYNC_QUIZ_ENGINE = AsyncQuizEngine() if ASYNC_ENGINE else None
+
+class QuizJob:
+    """One queued quiz sequence and its progress"""
+    
+    def __init__(self, url):
+        self.id = uuid.uuid4().hex[:12]
+        self.url = url
+        self.status = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.current_url = None
+        self.steps = []
+        self.error = None
+    
+    def add_step(self, url, answer, result, budget):
+        self.steps.append({
+            'url': url,
+            'answer': answer,
+            'correct': result.get('correct'),
+            'reason': result.get('reason'),
+            'timings': dict(budget.timings),
+            'seconds': round(time.time() - budget.started, 3)
+        })
+    
+    def to_dict(self):
+        now = time.time()
+        return {
+            'id': self.id,
+            'url': self.url,
+            'status': self.status,
+            'current_url': self.current_url,
+            'queued_seconds': round((self.started or now) - self.created, 3),
+            'run_seconds': round((self.finished or now) - self.started, 3) if self.started else None,
+            'steps_done': len(self.steps),
+            'correct': sum(1 for step in self.steps if step['correct']),
+            'steps': list(self.steps),
+            'error': self.error
+        }
+
+class JobQueue:
+    """Bounded queue drained by a fixed worker pool; identical in-flight URLs share one job"""
+    
+    def __init__(self, workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE, history=JOB_HISTORY, engine=None):
+        self.engine = engine
+        # With an engine, one thread dispatches and the engine runs up to ASYNC_MAX_SEQUENCES at once
+        self.workers = 1 if engine else workers
+        self._slots = threading.Semaphore(ASYNC_MAX_SEQUENCES) if engine else None
+        self.history = history
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = OrderedDict()
+        self._inflight = {}  # url -> job, while queued or running
+        self._lock = threading.Lock()
+        self._threads = []
+        self.stats = {'submitted': 0, 'deduplicated': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+    
+    def submit(self, url):
+        """Queue a sequence; returns (job, is_new) or raises queue.Full when saturated"""
+        with self._lock:
+            job = self._inflight.get(url)
+            if job is not None:
+                self.stats['deduplicated'] += 1
+                return job, False
+            job = QuizJob(url)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.stats['rejected'] += 1
+                raise
+            self._inflight[url] = job
+            self._jobs[job.id] = job
+            self.stats['submitted'] += 1
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.finished is None:
+                    break  # Never forget a job that is still queued or running
+                self._jobs.popitem(last=False)
+            self._start_workers()
+        return job, True
+    
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def _start_workers(self):
+        """Start the pool on first use so test mode never spawns idle threads"""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"quiz-job-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if self.engine:
+                self._slots.acquire()
+                job.status = 'running'
+                job.started = time.time()
+                future = self.engine.submit(solve_quiz_sequence_async(job.url, job=job))
+                future.add_done_callback(lambda f, job=job: self._finish(job, self._future_error(f)))
+                continue
+            
+            job.status = 'running'
+            job.started = time.time()
+            try:
+                solve_quiz_sequence(job.url, job=job)
+                self._finish(job)
+            except Exception as e:
+                self._finish(job, e)
+    
+    @staticmethod
+    def _future_error(future):
+        """Error of a finished engine future; exception() itself raises for a cancelled one"""
+        if future.cancelled():
+            return 'cancelled'
+        return future.exception()
+    
+    def _finish(self, job, error=None):
+        if error is not None:
+            job.error = str(error)
+        job.status = 'failed' if job.error else 'done'
+        job.finished = time.time()
+        with self._lock:
+            self._inflight.pop(job.url, None)
+            self.stats['failed' if job.error else 'completed'] += 1
+        if self._slots:
+            self._slots.release()
+        self._queue.task_done()
+    
+    def snapshot(self):
+        with self._lock:
+            running = sum(1 for job in self._inflight.values() if job.status == 'running')
+            return {**self.stats, 'workers': self.workers, 'queued': self._queue.qsize(),
+                    'running': running, 'capacity': self._queue.maxsize,
+                    'engine': 'async' if self.engine else 'threads'}
+
+JOB_QUEUE = JobQueue(engine=ASYNC_QUIZ_ENGINE)
 
 @app.route('/quiz', methods=['POST'])
 def handle_quiz():
     data = request.get_json()
     if not data or data.get('secret') != SECRET:
         return jsonify({"error": "Invalid"}), 403
+    if not data.get('url'):
+        return jsonify({"error": "Missing url"}), 400
     
-    thread = threading.Thread(target=solve_quiz_sequence, args=(data.get('url'),))
-    thread.daemon = True
-    thread.start()
+    try:
+        job, is_new = JOB_QUEUE.submit(data['url'])
+    except queue.Full:
+        # Refuse rather than pile more browsers onto a saturated box
+        return jsonify({"error": "Busy, try again later"}), 429, {'Retry-After': str(int(QUIZ_TIME_LIMIT))}
     
-    return jsonify({"status": "processing"}), 200
+    return jsonify({"status": "processing", "job_id": job.id, "deduplicated": not is_new}), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = JOB_QUEUE.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict()), 200
 
 @app.route('/health', methods=['GET'])
 @app.route('/', methods=['GET'])
@@ -813,15 +3992,26 @@ def health():
     return jsonify({
         "status": "ok", 
         "email": EMAIL, 
-        "stats": API_STATS
+        "stats": api_stats(),
+        "rate_limit": GEMINI_LIMITER.snapshot(),
+        "browsers": BROWSER_POOL.snapshot(),
+        "cache": CACHE.stats(),
+        "llm_cache": LLM_CACHE.stats(),
+        "disk_cache": DISK_CACHE.stats() if DISK_CACHE else None,
+        "rules": rule_stats(),
+        "jobs": JOB_QUEUE.snapshot()
     }), 200
 
 if __name__ == '__main__':
     if os.environ.get('TEST_MODE') or len(os.sys.argv) > 1:
         url = "https://tds-llm-analysis.s-anand.net/project2-reevals"
         print(f"\n🚀 TEST MODE\nEmail: {EMAIL}\nURL: {url}\n")
-        solve_quiz_sequence(url)
+        if ASYNC_QUIZ_ENGINE:
+            ASYNC_QUIZ_ENGINE.run(solve_quiz_sequence_async(url))
+        else:
+            solve_quiz_sequence(url)
     else:
         print(f"\n🚀 SERVER MODE\nEmail: {EMAIL}\n")
+        resolve_chromedriver()  # Resolve once at startup, not per quiz step
 
         app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+import main
+from main import BrowserPool
+
+
+class FakeDriver:
+    def __init__(self):
+        self.alive = True
+        self.quit_called = False
+        self.pages = []
+
+    def execute_script(self, script):
+        if not self.alive:
+            raise WebDriverException("chrome not reachable")
+        return 1
+
+    def delete_all_cookies(self):
+        if not self.alive:
+            raise WebDriverException("chrome not reachable")
+
+    def get(self, url):
+        self.pages.append(url)
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def drivers(monkeypatch):
+    launched = []
+    def launch():
+        launched.append(FakeDriver())
+        return launched[-1]
+    monkeypatch.setattr(main, 'setup_browser', launch)
+    return launched
+
+
+def test_reuses_a_released_browser(drivers):
+    pool = BrowserPool(size=2)
+    with pool.browser() as first:
+        pass
+    with pool.browser() as second:
+        assert second is first
+    assert len(drivers) == 1
+    assert first.pages == ['about:blank', 'about:blank']  # Reset after each checkout
+    assert pool.snapshot()['checkouts'] == 2
+
+
+def test_never_launches_more_than_size(drivers):
+    pool = BrowserPool(size=2)
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.1)
+    threading.Timer(0.1, pool.release, args=[held[0]]).start()
+    assert pool.acquire(timeout=2) is held[0]
+    assert len(drivers) == 2
+
+
+def test_recycles_crashed_and_worn_out_browsers(drivers):
+    pool = BrowserPool(size=1, max_uses=2)
+    with pytest.raises(WebDriverException):
+        with pool.browser():
+            raise WebDriverException("tab crashed")
+    assert drivers[0].quit_called
+
+    driver = pool.acquire()
+    pool.release(driver)
+    driver.alive = False  # Dies while idle: replaced on the next checkout
+    assert pool.acquire() is drivers[2]
+    assert drivers[1].quit_called
+
+    pool.release(drivers[2])
+    assert pool.acquire() is drivers[2]
+    pool.release(drivers[2])  # Second use reaches max_uses
+    assert drivers[2].quit_called
+    assert pool.snapshot()['alive'] == 0
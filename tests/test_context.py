@@ -0,0 +1,25 @@
+from main import Artifact, QuizContext, TextFile, estimate_tokens, pack_context
+
+QUESTION = "Q: What is the total amount for region north? " + "Some long preamble about the quiz. " * 300
+FILLER = "\n".join(f"line {i}: nothing relevant here at all" for i in range(2000)).encode()
+
+
+def test_quiz_text_is_pinned_in_full():
+    ctx = QuizContext(QUESTION)
+    ctx.add(Artifact('text', 'notes.txt', TextFile(FILLER)))
+    packed = pack_context("total amount region north", ctx, budget_tokens=500)
+    assert packed.startswith("QUIZ TEXT:\n" + QUESTION)
+    artifacts = packed[len("QUIZ TEXT:\n" + QUESTION):]
+    assert 0 < estimate_tokens(artifacts) <= 600  # Labels and separators aside, the budget holds
+
+
+def test_plain_string_keeps_quiz_text():
+    text = "QUIZ TEXT:\n" + QUESTION + "\n" + "".join(f"\nPDF PAGE {n}:\n" + "numbers " * 400 for n in range(1, 20))
+    packed = pack_context("total amount region north", text, budget_tokens=1000)
+    assert packed.startswith("QUIZ TEXT:\n" + QUESTION.strip())
+    assert "PDF PAGE" in packed
+
+
+def test_small_context_is_unchanged():
+    ctx = QuizContext("What is 2 + 2?")
+    assert pack_context("2 + 2", ctx) == ctx.text
@@ -0,0 +1,51 @@
+import io
+
+import pandas as pd
+import pytest
+
+from main import Artifact, QuizContext, ingest_csv, solve_with_rules
+
+CSV = "id,status,amount,city\n" + "".join(
+    f"{i},{200 if i % 3 else 404},{i * 1.5},{'ab'[i % 2]}\n" for i in range(1, 1001)
+)
+
+
+def ask(question, table):
+    ctx = QuizContext("quiz")
+    ctx.add(Artifact('csv', 'data.csv', table))
+    return solve_with_rules(question, ctx)
+
+
+@pytest.mark.parametrize('chunk_rows', [64, 10 ** 6])
+def test_stats_match_pandas(chunk_rows):
+    table = ingest_csv(CSV.encode(), 'utf-8', chunk_rows=chunk_rows)
+    df = pd.read_csv(io.StringIO(CSV))
+    assert table.rows == len(df)
+    assert table.numeric_columns == ['id', 'status', 'amount']
+    assert table.stats['amount']['sum'] == pytest.approx(df['amount'].sum())
+    assert table.stats['id']['max'] == df['id'].max()
+    assert table.mean('amount') == pytest.approx(df['amount'].mean())
+    assert table.value_counts['status'][200] == (df['status'] == 200).sum()
+
+
+def test_column_that_turns_to_text_is_demoted():
+    content = "id,score\n" + "".join(f"{i},{i}\n" for i in range(100)) + "100,unknown\n"
+    table = ingest_csv(content.encode(), 'utf-8', chunk_rows=50)
+    assert 'score' not in table.numeric_columns
+    assert table.dtypes['score'] == 'object'
+    assert table.stats['id']['sum'] == sum(range(101))
+
+
+def test_status_count_from_index():
+    table = ingest_csv(CSV.encode(), 'utf-8', chunk_rows=64)
+    answer, rule = ask("How many rows have status 200?", table)
+    assert rule.name == 'csv'
+    assert answer == sum(1 for i in range(1, 1001) if i % 3)
+
+
+def test_status_count_never_returns_row_count(monkeypatch):
+    monkeypatch.setattr('main.CSV_MAX_DISTINCT', 1)  # status is too varied to index
+    table = ingest_csv(CSV.encode(), 'utf-8', chunk_rows=64)
+    assert 'status' not in table.value_counts
+    table.frame = None  # As for files too big to keep whole
+    assert ask("How many rows have status 200?", table) == (None, None)
@@ -0,0 +1,50 @@
+import os
+import pickle
+
+import pandas as pd
+import pandas.testing as pdt
+
+from main import DiskCache, ingest_csv
+
+CSV = b"id,name,score\n" + b"".join(f"{i},n{i},{i * 0.5}\n".encode() for i in range(50))
+
+
+def fake_parquet(monkeypatch):
+    """Stand-in engine for trees without pyarrow, so the split storage is exercised either way"""
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', lambda self, path, index=False: self.to_pickle(path))
+    monkeypatch.setattr(pd, 'read_parquet', pd.read_pickle)
+
+
+def test_csv_frame_is_stored_as_parquet_beside_the_stats(tmp_path, monkeypatch):
+    fake_parquet(monkeypatch)
+    cache = DiskCache(str(tmp_path))
+    table = ingest_csv(CSV, 'utf-8')
+    cache.put_parsed('abc', 'csv_table', table)
+
+    base = tmp_path / 'parsed' / 'abc.csv_table'
+    assert os.path.exists(f"{base}.parquet")
+    assert not isinstance(pickle.loads(open(f"{base}.pkl", 'rb').read()).frame, pd.DataFrame)
+    assert table.frame is not None  # The caller's table keeps its frame
+
+    loaded = cache.get_parsed('abc', 'csv_table')
+    pdt.assert_frame_equal(loaded.frame, table.frame)
+    assert loaded.stats == table.stats and loaded.rows == 50
+
+
+def test_missing_parquet_is_a_miss(tmp_path, monkeypatch):
+    fake_parquet(monkeypatch)
+    cache = DiskCache(str(tmp_path))
+    cache.put_parsed('abc', 'csv_table', ingest_csv(CSV, 'utf-8'))
+    os.remove(tmp_path / 'parsed' / 'abc.csv_table.parquet')
+    assert cache.get_parsed('abc', 'csv_table') is None
+
+
+def test_falls_back_to_pickle_when_parquet_fails(tmp_path, monkeypatch):
+    def no_engine(self, path, index=False):
+        raise ImportError("no parquet engine")
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', no_engine)
+    cache = DiskCache(str(tmp_path))
+    table = ingest_csv(CSV, 'utf-8')
+    cache.put_parsed('abc', 'csv_table', table)
+    assert not os.path.exists(tmp_path / 'parsed' / 'abc.csv_table.parquet')
+    pdt.assert_frame_equal(cache.get_parsed('abc', 'csv_table').frame, table.frame)
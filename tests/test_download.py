@@ -0,0 +1,45 @@
+import threading
+
+from main import ByteBudget, read_response_body
+
+
+class ChunkedResponse:
+    """A streamed response with no Content-Length"""
+
+    def __init__(self, chunks, on_chunk=None):
+        self.headers = {}
+        self.chunks = chunks
+        self.on_chunk = on_chunk
+
+    def iter_content(self, size):
+        for chunk in self.chunks:
+            yield chunk
+            if self.on_chunk:
+                self.on_chunk()
+
+    def close(self):
+        pass
+
+
+def test_budget_is_charged_as_chunks_arrive():
+    budget = ByteBudget(1000)
+    seen = []
+    response = ChunkedResponse([b'x' * 100] * 5, on_chunk=lambda: seen.append(budget.in_use))
+    with budget.reserve(50) as grow:
+        assert read_response_body(response, charge=grow) == b'x' * 500
+        assert budget.in_use == 500
+    assert seen == [100, 200, 300, 400, 500]
+    assert budget.in_use == 0
+
+
+def test_grown_download_holds_back_new_reservations():
+    budget = ByteBudget(300)
+    started = threading.Event()
+    with budget.reserve(0) as grow:
+        read_response_body(ChunkedResponse([b'x' * 200] * 2), charge=grow)  # Over the cap: never blocks itself
+        thread = threading.Thread(target=lambda: (budget.acquire(100), started.set()))
+        thread.start()
+        assert not started.wait(0.2)
+    assert started.wait(2)
+    thread.join()
+    assert budget.in_use == 100
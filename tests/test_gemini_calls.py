@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Gemini plumbing with a local limiter and a scripted model"""
+    replies = []
+    monkeypatch.setattr(main, 'RATE_STATE', main.LocalRateState())
+    monkeypatch.setattr(main, 'GEMINI_LIMITER', main.TokenBucketLimiter(calls_per_minute=6000, burst=10,
+                                                                        backend=main.RATE_STATE))
+    monkeypatch.setattr(main, 'gemini_request', lambda question, context: ('key', 'prompt'))
+    monkeypatch.setattr(main, 'get_cached_answer', lambda key: None)
+    monkeypatch.setattr(main, 'store_cached_answer', lambda key, answer: None)
+    monkeypatch.setattr(main, 'get_gemini_model', lambda: None)
+    monkeypatch.setattr(main, 'retry_delay', lambda error, attempt: 0.0)
+
+    def generate_answer(model, prompt, stop):
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    monkeypatch.setattr(main, 'generate_answer', generate_answer)
+    return replies
+
+
+def solve_sync(question):
+    return main.solve_with_gemini_safe(question, "context")
+
+
+def solve_async(question):
+    return asyncio.run(main.solve_with_gemini_async(question, "context"))
+
+
+@pytest.mark.parametrize('solve', [solve_sync, solve_async])
+def test_rate_limit_is_retried(gemini, solve):
+    gemini.extend([RuntimeError("429 quota exceeded"), "42"])
+    assert solve("q") == "42"
+    assert main.api_stats()['total_calls'] == 2
+
+
+@pytest.mark.parametrize('solve', [solve_sync, solve_async])
+def test_other_errors_give_up(gemini, solve):
+    gemini.extend([RuntimeError("bad request"), "never used"])
+    assert solve("q") is None
+    assert main.api_stats()['total_calls'] == 1
+
+
+@pytest.mark.parametrize('solve', [solve_sync, solve_async])
+def test_gives_up_after_max_attempts(gemini, solve):
+    gemini.extend([RuntimeError("429")] * main.GEMINI_MAX_ATTEMPTS)
+    assert solve("q") is None
+    assert main.api_stats()['total_calls'] == main.GEMINI_MAX_ATTEMPTS
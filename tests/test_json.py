@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from main import JsonDocument
+
+RECORDS = [
+    {"id": 1, "status": 200, "ok": True, "sentiment": "positive", "tags": ["a", "b"]},
+    {"id": 2, "status": 404, "ok": 1, "sentiment": "negative", "tags": []},
+    {"id": 3, "status": 200, "ok": False, "sentiment": "positive", "compression": "gzip"},
+    {"id": 4, "status": 500, "ok": 0, "sentiment": "neutral"},
+]
+
+
+@pytest.mark.parametrize('keep_chars', [10 ** 9, 0])  # Records kept, or decoded again from offsets
+def test_index_counts_and_finds(keep_chars):
+    doc = JsonDocument(json.dumps(RECORDS, indent=2), keep_chars=keep_chars)
+    assert doc.paths['[]'].count == 4
+    assert doc.count_value('status', 200) == 2
+    assert doc.count_value('sentiment', 'positive') == 2
+    assert doc.count_value('missing', 1) is None
+    assert doc.find_record('compression', 'gzip') == RECORDS[2]
+    assert doc.record('[]', 3) == RECORDS[3]
+    assert doc.paths['[].tags[]'].count == 2
+
+
+def test_booleans_and_numbers_are_counted_apart():
+    doc = JsonDocument(json.dumps(RECORDS))
+    assert doc.count_value('ok', True) == 1
+    assert doc.count_value('ok', 1) == 1
+    assert doc.count_value('ok', False) == 1
+    assert doc.count_value('ok', 0) == 1
+    assert doc.find_record('ok', 1) == RECORDS[1]
+
+
+def test_nested_document():
+    doc = JsonDocument(json.dumps({"config": {"api_key": "abc"}, "tweets": [{"sentiment": "positive"}]}))
+    assert doc.first_value('api_key') == 'abc'
+    assert doc.count_value('sentiment', 'positive') == 1
+
+
+@pytest.mark.parametrize('text', ['[1 2 3]', '[1, 2,]', '[1, 2', '[1, 2] 3', '[{"a": 1} {"a": 2}]'])
+def test_malformed_arrays_raise(text):
+    with pytest.raises(json.JSONDecodeError):
+        JsonDocument(text)
+
+
+@pytest.mark.parametrize('text', ['[]', ' [ ] ', '[1,2 , 3]\n'])
+def test_well_formed_arrays(text):
+    doc = JsonDocument(text)
+    assert len(doc.offsets) == len(json.loads(text))
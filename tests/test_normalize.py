@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from main import normalize_columns
+
+
+def normalize_by_row(df):
+    """The row-by-row mapping normalize_columns replaced, kept as the reference"""
+    result = []
+    for _, row in df.iterrows():
+        item = {}
+        for col in df.columns:
+            col_lower = col.lower()
+            val = row[col]
+            if pd.isna(val):
+                continue
+            if col_lower == 'id':
+                item['id'] = int(val)
+            elif 'first' in col_lower and 'first_name' not in item:
+                item['first_name'] = val
+            elif 'last' in col_lower and 'last_name' not in item:
+                item['last_name'] = val
+            elif 'email' in col_lower or '@' in str(val):
+                item['email'] = val
+            elif 'name' in col_lower:
+                if 'first_name' not in item:
+                    item['first_name'] = val
+                elif 'last_name' not in item:
+                    item['last_name'] = val
+        result.append(item)
+    return sorted(result, key=lambda x: x.get('id', 0))
+
+
+FRAMES = {
+    'plain': pd.DataFrame({'ID': [3, 1, 2], 'First Name': ['c', 'a', 'b'], 'Last Name': ['z', 'x', 'y'],
+                           'E-mail': ['c@x', 'a@x', 'b@x']}),
+    'name columns': pd.DataFrame({'id': [2, 1], 'name': ['Ann', 'Bob'], 'surname': ['Lee', 'Ray'],
+                                  'contact': ['ann@x.io', 'bob@x.io']}),
+    'gaps': pd.DataFrame({'id': [2.0, np.nan, 1.0], 'first': ['a', None, 'c'], 'firstname': ['A', 'B', None],
+                          'last': [None, 'y', 'z'], 'misc': ['m@x', 'plain', np.nan]}),
+    'no id': pd.DataFrame({'name': ['x', 'y'], 'other': [1, 2]}),
+    'unmapped': pd.DataFrame({'a': [1, 2], 'b': [3, 4]}),
+}
+
+
+@pytest.mark.parametrize('name', FRAMES)
+def test_matches_row_by_row_mapping(name):
+    df = FRAMES[name]
+    assert normalize_columns(df) == normalize_by_row(df)
+
+
+def test_random_frames_match():
+    rng = np.random.default_rng(0)
+    pool = np.array(['a', 'b@x', None, 'c', 'd@y'], dtype=object)
+    for _ in range(20):
+        df = pd.DataFrame({
+            'id': rng.permutation(30),
+            'first': rng.choice(pool, 30),
+            'last_name': rng.choice(pool, 30),
+            'name': rng.choice(pool, 30),
+            'email': rng.choice(pool, 30),
+        })
+        assert normalize_columns(df) == normalize_by_row(df)
@@ -0,0 +1,22 @@
+import main
+from main import StepPacer
+
+
+def test_pacer_backs_off_and_recovers():
+    pacer = StepPacer(min_gap=0.5, max_gap=30)
+    pacer.observe(500)
+    pacer.observe(None)
+    assert pacer.gap == 4.0
+    pacer.observe(200)
+    assert pacer.gap == 2.0
+
+
+def test_submission_errors_only_slow_their_own_sequence(monkeypatch):
+    def fail(*args, **kwargs):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(main.HTTP_SESSION, 'post', fail)
+    failing, healthy = StepPacer(), StepPacer()
+    result = main.submit_answer("https://example.com/submit", "https://example.com/q1", 42, pacer=failing)
+    assert result['correct'] is False
+    assert failing.gap > healthy.gap == healthy.min_gap
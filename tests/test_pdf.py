@@ -0,0 +1,52 @@
+import pytest
+
+from main import Artifact, QuizContext, pages_mentioned, solve_with_rules, text_tables
+
+PAGE = """Quarterly report
+Region    Q1     Q2     Unit Price
+North     100    150    2.50
+South     200    250    3.00
+East      300    350    4.25
+Prepared by finance"""
+
+
+@pytest.mark.parametrize('question, pages', [
+    ("What is the total on page 2?", {2}),
+    ("Sum the values from pages 3-5", {3, 4, 5}),
+    ("Read page 4 of the PDF", {4}),
+    ("Download the file. Go to page 2 of the quiz for more.", set()),
+    ("Submit your answer. Page 2 follows.", set()),
+    ("See the attached report (2 pages).", set()),
+])
+def test_pages_mentioned_needs_an_explicit_reference(question, pages):
+    assert pages_mentioned(question) == pages
+
+
+def test_text_tables_finds_aligned_rows():
+    [table] = text_tables(PAGE)
+    assert list(table.columns) == ['Region', 'Q1', 'Q2', 'Unit Price']
+    assert table['Q2'].sum() == 750
+
+
+@pytest.mark.parametrize('question, expected', [
+    ("What is the total of Q2 in the PDF?", 750),
+    ("What is the average unit price?", 3.25),
+    ("What is the max Q1 value?", 300),
+])
+def test_pdf_table_rule(question, expected):
+    ctx = QuizContext("quiz")
+    ctx.add(Artifact('pdf', 'report.pdf', {1: PAGE}))
+    answer, rule = solve_with_rules(question, ctx)
+    assert rule.name == 'pdf_table'
+    assert answer == expected
+
+
+@pytest.mark.parametrize('question', [
+    "Determine the unit price of East on page 1 of the PDF.",
+    "What does the table say about the summit region's Q1?",
+])
+def test_pdf_table_lookup_does_not_aggregate(question):
+    ctx = QuizContext("quiz")
+    ctx.add(Artifact('pdf', 'report.pdf', {1: PAGE}))
+    answer, rule = solve_with_rules(question, ctx)
+    assert rule is None or rule.name != 'pdf_table'
@@ -0,0 +1,29 @@
+import threading
+import time
+
+from main import LocalRateState, TokenBucketLimiter
+
+
+def test_cancelled_caller_takes_no_slot():
+    limiter = TokenBucketLimiter(calls_per_minute=60, burst=1, backend=LocalRateState())
+    cancel = threading.Event()
+    cancel.set()
+    assert not limiter.acquire(cancel=cancel)
+    assert limiter.reserve() == 0  # The slot is still free
+
+
+def test_cancel_while_waiting_releases_the_slot():
+    limiter = TokenBucketLimiter(calls_per_minute=60, burst=1, backend=LocalRateState())
+    assert limiter.acquire()
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+    start = time.time()
+    assert not limiter.acquire(cancel=cancel)
+    assert time.time() - start < 0.5
+    assert limiter.reserve() <= 1.0  # Next caller waits for one interval, not two
+
+
+def test_deadline_refuses_late_slot():
+    limiter = TokenBucketLimiter(calls_per_minute=60, burst=1, backend=LocalRateState())
+    assert limiter.acquire()
+    assert not limiter.acquire(deadline=time.time() + 0.1)
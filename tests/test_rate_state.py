@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.skipif(main.fcntl is None, reason="needs flock")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def bump(state, times):
+    for _ in range(times):
+        with state.transaction() as s:
+            s['total_calls'] += 1
+
+
+def test_forked_workers_exclude_each_other(tmp_path):
+    state = main.SharedRateState(str(tmp_path / 'rate.bin'))
+    children = []
+    for _ in range(4):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                bump(state, 500)
+            finally:
+                os._exit(0)
+        children.append(pid)
+    bump(state, 500)
+    for pid in children:
+        os.waitpid(pid, 0)
+    with state.transaction() as s:
+        assert s['total_calls'] == 2500
+
+
+def test_state_from_an_earlier_run_is_reset(tmp_path):
+    path = str(tmp_path / 'rate.bin')
+    penalise = ("import sys, time, main; state = main.SharedRateState(sys.argv[1])\n"
+                "with state.transaction() as s: s['blocked_until'] = time.time() + 600; s['total_calls'] = 7\n")
+    subprocess.run([sys.executable, '-c', penalise, path], cwd=ROOT, check=True, capture_output=True)
+    state = main.SharedRateState(path)
+    with state.transaction() as s:
+        assert s['blocked_until'] == 0.0
+        assert s['total_calls'] == 0
+
+
+def test_live_state_is_shared(tmp_path):
+    path = str(tmp_path / 'rate.bin')
+    first = main.SharedRateState(path)
+    bump(first, 3)
+    second = main.SharedRateState(path)
+    with second.transaction() as s:
+        assert s['total_calls'] == 3
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from main import cosine_similarity, cosine_similarity_matrix, top_k_similar
+
+
+def test_cosine_pairs():
+    assert cosine_similarity([1, 0], [0, 1])[0] == pytest.approx(0.0)
+    assert cosine_similarity([1, 2, 3], [2, 4, 6])[0] == pytest.approx(1.0)
+    assert cosine_similarity([0, 0], [1, 1])[0] == 0.0  # Zero vectors do not divide by zero
+    np.testing.assert_allclose(cosine_similarity([[1, 0], [1, 1]], [[1, 0], [-1, -1]]), [1.0, -1.0])
+
+
+def test_matrix_matches_pairwise():
+    rng = np.random.default_rng(1)
+    queries, corpus = rng.normal(size=(3, 8)), rng.normal(size=(5, 8))
+    matrix = cosine_similarity_matrix(queries, corpus)
+    for i in range(3):
+        for j in range(5):
+            assert matrix[i, j] == pytest.approx(cosine_similarity(queries[i], corpus[j])[0])
+
+
+def test_top_k_is_best_first():
+    corpus = [[1, 0], [0, 1], [1, 1], [-1, 0]]
+    assert [row for row, _ in top_k_similar([1, 0.1], corpus, k=3)] == [0, 2, 1]
+    assert top_k_similar([1, 0], corpus, k=10)[-1][0] == 3
@@ -0,0 +1,82 @@
+import sqlite3
+import time
+
+import pytest
+
+from main import Artifact, QuizContext, SqlDatabase, solve_with_rules
+
+
+def make_dump(rows=12000):
+    src = sqlite3.connect(':memory:')
+    src.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, age INTEGER)')
+    src.executemany('INSERT INTO users VALUES (?, ?, ?)', [(i, f"user;{i}", i % 50) for i in range(rows)])
+    src.commit()
+    return src, '\n'.join(src.iterdump())
+
+
+def test_iterdump_loads_every_row_once():
+    src, dump = make_dump()
+    assert 'BEGIN TRANSACTION;' in dump and 'COMMIT;' in dump
+    db = SqlDatabase(dump, batch_size=1000)
+    assert db.row_counts == {'users': 12000}
+    expected = src.execute('SELECT COUNT(*) FROM users WHERE age > 18').fetchone()[0]
+    assert db.answer('SELECT COUNT(*) FROM users WHERE age > 18') == expected
+
+
+def test_failed_batch_is_replayed_without_duplicates():
+    dump = ("BEGIN TRANSACTION;\n"
+            "CREATE TABLE t (a);\n"
+            "INSERT INTO t VALUES (1); INSERT INTO t VALUES ('x;y');\n"
+            "NOT SQL AT ALL;\n"
+            "INSERT INTO t VALUES (3);\n"
+            "COMMIT;\n")
+    db = SqlDatabase(dump)
+    assert db.row_counts == {'t': 3}
+    assert db.skipped == 1
+    assert db.answer('SELECT a FROM t ORDER BY rowid') == [1, 'x;y', 3]
+
+
+def test_mysql_dump_options_are_stripped():
+    dump = ("SET NAMES utf8mb4;\n"
+            "LOCK TABLES `p` WRITE;\n"
+            "CREATE TABLE p (id INT, price INT) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;\n"
+            "INSERT INTO p VALUES (1, 10), (2, 20);\n"
+            "UNLOCK TABLES;\n")
+    db = SqlDatabase(dump)
+    assert db.answer('SELECT SUM(price) FROM p') == 30
+
+
+def test_runaway_query_stops_at_deadline():
+    _, dump = make_dump(rows=10)
+    db = SqlDatabase(dump)
+    runaway = 'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c'
+    start = time.time()
+    with pytest.raises(sqlite3.OperationalError):
+        db.query(runaway, deadline=time.time() + 0.2)
+    assert time.time() - start < 2
+    assert db.answer('SELECT COUNT(*) FROM users') == 10
+
+
+@pytest.mark.parametrize('statement', ["ATTACH DATABASE '{path}' AS x; CREATE TABLE x.t (a);", "VACUUM INTO '{path}';"])
+def test_dump_cannot_write_other_files(tmp_path, statement):
+    path = tmp_path / 'pwned.db'
+    dump = "CREATE TABLE t (a);\nINSERT INTO t VALUES (1);\n" + statement.format(path=path) + "\n"
+    db = SqlDatabase(dump)
+    assert not path.exists()
+    assert db.skipped >= 1
+    assert db.row_counts == {'t': 1}
+
+
+@pytest.mark.parametrize('question, expected', [
+    ("How many users are there in the database?", 3),
+    ("What is the number of orders in the sql dump?", 1),
+    ("How many users have age > 25?", 2),
+])
+def test_counts_a_named_table(question, expected):
+    db = SqlDatabase("CREATE TABLE users (id INT, age INT);\nINSERT INTO users VALUES (1, 20), (2, 30), (3, 40);\n"
+                     "CREATE TABLE orders (id INT, user_id INT);\nINSERT INTO orders VALUES (1, 1);\n")
+    ctx = QuizContext("quiz")
+    ctx.add(Artifact('sql', 'data.sql', db))
+    answer, rule = solve_with_rules(question, ctx)
+    assert rule.name == 'sql'
+    assert answer == expected
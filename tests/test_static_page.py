@@ -0,0 +1,66 @@
+import pytest
+
+import main
+
+STATIC = """<html><head><title>Quiz 3</title><style>p { color: red }</style></head>
+<body>
+<h1>Question&nbsp;3</h1>
+<p>What is the <b>sum</b> of the <i>value</i> column?</p>
+<table><tr><td>a</td><td>1</td></tr><tr><td>b</td><td>2</td></tr></table>
+<pre>x   y
+1   2</pre>
+<!-- hidden note -->
+<p>Post your answer to https://example.com/submit</p>
+<script>console.log(1 < 2)</script>
+</body></html>"""
+
+SHELL = """<html><body><div id="q"></div>
+<p>Loading... answer at https://example.com/submit</p>
+<script>
+if (1 < 2) { document.getElementById('q').innerHTML = atob('V2hhdD8='); }
+</script></body></html>"""
+
+
+class FakeResponse:
+    headers = {'Content-Type': 'text/html'}
+
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    def serve(html):
+        monkeypatch.setattr(main.HTTP_SESSION, 'get', lambda url, timeout=None: FakeResponse(html))
+    return serve
+
+
+def test_text_matches_rendered_layout():
+    assert main.html_to_text(STATIC) == (
+        "Question 3\n"
+        "What is the sum of the value column?\n"
+        "a 1\n"
+        "b 2\n"
+        "x   y\n1   2\n"
+        "Post your answer to https://example.com/submit"
+    )
+
+
+def test_static_page_is_used(serve):
+    serve(STATIC)
+    text, html = main.fetch_static_page("https://example.com/q3")
+    assert text.startswith("Question 3")
+    assert html == STATIC
+
+
+def test_script_with_angle_brackets_is_dynamic(serve):
+    serve(SHELL)
+    assert main.fetch_static_page("https://example.com/q3") is None
+
+
+def test_page_without_submit_url_needs_browser(serve):
+    serve("<html><body><p>What is 2 + 2? Submit below.</p></body></html>")
+    assert main.fetch_static_page("https://example.com/q3") is None
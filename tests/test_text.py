@@ -0,0 +1,66 @@
+import pytest
+
+from main import Artifact, QuizContext, TextFile, solve_with_rules
+
+LOG = (b"2024-01-01 INFO the service started\n"
+       b"2024-01-01 ERROR the disk is full\n"
+       b"2024-01-02 WARNING the disk is nearly full\n"
+       b"2024-01-02 INFO error count reset\n")
+
+
+def ask(question, content=LOG):
+    ctx = QuizContext("quiz")
+    ctx.add(Artifact('text', 'app.log', TextFile(content)))
+    return solve_with_rules(question, ctx)
+
+
+def test_counts_match_python():
+    text = TextFile(LOG)
+    decoded = LOG.decode()
+    assert text.lines == len(decoded.splitlines())
+    assert text.words == len(decoded.split())
+    assert text.chars == len(decoded)
+    assert text.pattern_counts['error'] == 2
+
+
+@pytest.mark.parametrize('question, expected', [
+    ("How many lines contain the word ERROR?", 1),
+    ("How many lines mention the string 'error'?", 2),
+    ("How many lines contain ERROR?", 1),
+    ('How many lines contain "the disk"?', 2),
+    ("How many times does the word disk appear?", 2),
+    ("How many times does INFO appear in the log?", 2),
+])
+def test_term_questions(question, expected):
+    answer, rule = ask(question)
+    assert rule.name == 'text_stats'
+    assert answer == expected
+
+
+def test_utf16_counts_characters_and_tokens():
+    content = "héllo wörld\nhéllo\n".encode('utf-16')
+    text = TextFile(content)
+    assert text.encoding == 'utf-16'
+    assert text.chars == len("héllo wörld\nhéllo\n")
+    assert text.lines == 2
+    assert text.top_tokens(1) == [('héllo', 2)]
+    assert text.count_matches('wörld') == 1
+
+
+def test_latin1_counts_characters():
+    content = "café crème\n".encode('latin-1')
+    text = TextFile(content)
+    assert text.encoding == 'latin-1'
+    assert text.chars == 11
+    assert dict(text.top_tokens()) == {'café': 1, 'crème': 1}
+
+
+def test_long_lines_are_cut_between_words():
+    line = b" ".join(b"word%d" % i for i in range(500))
+    content = line + b" ERROR\n" + line + b"\n"
+    text = TextFile(content, chunk_size=64)
+    assert text.words == len(content.split())
+    assert sum(text.tokens.values()) == len(content.split())
+    assert text.count_lines('word1') == 2
+    assert text.count_lines('ERROR') == 1
+    assert text.lines == 2